@@ -1,9 +1,10 @@
 import logging
-import asyncio
-from telegram.ext import Application, MessageHandler, filters, CallbackQueryHandler
+from typing import Callable, Optional
+from telegram.ext import Application, MessageHandler, filters, CallbackQueryHandler, ContextTypes
 from telegram import Update
 from config import BOT_TOKEN
 import database as db
+from application import ChatOrderedApplication, MAX_CONCURRENT_UPDATES
 
 # Import handlers
 from handlers.common import (
@@ -26,6 +27,13 @@ from handlers.admin_feedback import (
     feedback_conv, handle_user_rating
 )
 
+# حلقه‌ی رویداد مبتنی بر libuv در صورت نصب بودن (روی ویندوز در دسترس نیست)
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 # تنظیم لاگر
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -36,12 +44,78 @@ logging.getLogger("telegram").setLevel(logging.WARNING)
 logging.getLogger("apscheduler").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-async def main() -> None:
+# --- مسیریابی دکمه‌های منوی اصلی ---
+# متن دکمه‌ها ثابت است؛ تطابق دقیق با دیکشنری انجام می‌شود
+MENU_ROUTES = {
+    "دوره‌ها/بازدیدها 📅": show_events,
+    "ارتباط با پشتیبانی 📞": unknown_text,  # TODO: Support handler
+    "سوالات متداول ❓": faq,
+    "منوی ادمین ⚙️": admin_menu,
+    "بازگشت 🔙": back_to_main,
+}
+# filters.Text فقط عضویت را بررسی می‌کند؛ frozenset این بررسی را O(1) می‌کند
+MENU_TEXTS = frozenset(MENU_ROUTES)
+
+async def dispatch_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """پیام دکمه‌های منو را با یک جست‌وجوی دیکشنری به هندلر مربوطه می‌فرستد."""
+    handler = MENU_ROUTES.get(update.message.text)
+    if handler:
+        await handler(update, context)
+
+# --- مسیریابی Callback Queryهای عمومی ---
+# به‌جای regex، callback_data با جدول دقیق و سپس با پیشوندها (بلندترین اول) مقایسه می‌شود
+CALLBACK_EXACT = {
+    "check_membership": check_membership,
+    "back_to_events": show_events,
+}
+CALLBACK_PREFIXES = tuple(sorted((
+    ("event_", event_details),
+    ("register_", register_event),
+    ("confirm_payment_", payment_action),
+    ("unclear_payment_", payment_action),
+    ("cancel_payment_", payment_action),
+    ("confirm_", payment_action),
+    ("done", payment_action),
+    ("rate_", handle_user_rating),  # هندلر امتیازدهی کاربر
+), key=lambda route: len(route[0]), reverse=True))
+
+def route_callback(data: object) -> Optional[Callable]:
+    """هندلر مربوط به callback_data را برمی‌گرداند (None اگر مسیری نداشته باشد)."""
+    if not isinstance(data, str):
+        return None
+    handler = CALLBACK_EXACT.get(data)
+    if handler:
+        return handler
+    for prefix, handler in CALLBACK_PREFIXES:
+        if data.startswith(prefix):
+            return handler
+    return None
+
+async def dispatch_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Callback را به هندلری که route_callback پیدا می‌کند می‌فرستد."""
+    await route_callback(update.callback_query.data)(update, context)
+
+async def on_startup(app: Application) -> None:
+    """قبل از شروع polling پایگاه داده را راه‌اندازی می‌کند."""
+    await db.init_db()
+
+async def on_shutdown(app: Application) -> None:
+    """پس از توقف ربات اتصال‌های پایگاه داده را می‌بندد."""
+    await db.close_db()
+
+def main() -> None:
     """راه‌اندازی و اجرای ربات."""
-    await db.init_db()  # راه‌اندازی پایگاه داده
-    
     # ساخت اپلیکیشن
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        # آپدیت‌های چت‌های مختلف هم‌زمان و آپدیت‌های هر چت به ترتیب پردازش می‌شوند
+        .application_class(ChatOrderedApplication)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .post_init(on_startup)  # راه‌اندازی پایگاه داده
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     # --- ثبت Conversation Handlers ---
     app.add_handler(profile_conv)
@@ -56,46 +130,18 @@ async def main() -> None:
     app.add_handler(feedback_conv)        # هندلر نظرسنجی جدید
     
     # --- ثبت Message Handlers ---
-    app.add_handler(MessageHandler(filters.Regex("^(دوره‌ها/بازدیدها 📅)$"), show_events))
-    app.add_handler(MessageHandler(filters.Regex("^(ارتباط با پشتیبانی 📞)$"), unknown_text))  # TODO: Support handler
-    app.add_handler(MessageHandler(filters.Regex("^(سوالات متداول ❓)$"), faq))
-    app.add_handler(MessageHandler(filters.Regex("^(منوی ادمین ⚙️)$"), admin_menu))
-    app.add_handler(MessageHandler(filters.Regex("^(بازگشت 🔙)$"), back_to_main))
+    app.add_handler(MessageHandler(filters.Text(MENU_TEXTS), dispatch_menu))
     
     # هندلر رسید پرداخت (باید اولویت کمتری داشته باشد)
     app.add_handler(MessageHandler(filters.PHOTO & ~filters.COMMAND, handle_payment_receipt))
     
     # --- ثبت Callback Query Handlers ---
-    app.add_handler(CallbackQueryHandler(check_membership, pattern="^check_membership$"))
-    app.add_handler(CallbackQueryHandler(event_details, pattern="^event_"))
-    app.add_handler(CallbackQueryHandler(register_event, pattern="^register_"))
-    app.add_handler(CallbackQueryHandler(show_events, pattern="^back_to_events$"))
-    app.add_handler(CallbackQueryHandler(payment_action, pattern="^(confirm_payment_|unclear_payment_|cancel_payment_|confirm_|done)"))
-    app.add_handler(CallbackQueryHandler(handle_user_rating, pattern="^rate_"))  # هندلر امتیازدهی کاربر
+    app.add_handler(CallbackQueryHandler(dispatch_callback, pattern=lambda data: route_callback(data) is not None))
     
     logger.info("Bot is starting...")
     
-    # استفاده از app.run_polling() بدون asyncio.run()
-    async with app:
-        await app.initialize()
-        await app.start()
-        await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
-        try:
-            # Keep the bot running
-            while True:
-                await asyncio.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Bot stopping...")
-        finally:
-            await app.updater.stop()
-            await app.stop()
+    # run_polling خودش سیگنال‌ها، انتظار و خاموش شدن را مدیریت می‌کند
+    app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
-    # Use nest_asyncio to allow nested event loops if needed
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Bot interrupted by user")
-    except RuntimeError as e:
-        if "Cannot close a running event loop" in str(e):
-            logger.info("Bot stopped")
\ No newline at end of file
+    main()
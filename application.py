@@ -0,0 +1,115 @@
+# application.py
+# پردازش هم‌زمان آپدیت‌های چت‌های مختلف با حفظ ترتیب آپدیت‌های هر چت
+import asyncio
+import logging
+from typing import Dict
+import telegram
+from telegram import Update
+from telegram.ext import Application
+from broadcast import drain_group_queues
+
+# ChatOrderedApplication متد داخلی _update_fetcher و سیگنال _STOP_SIGNAL را بازنویسی/استفاده
+# می‌کند که جزو API عمومی PTB نیستند؛ فقط با همین نسخه (که در requirements.txt ثابت شده)
+# بررسی شده است و با نسخه‌ی دیگر به‌جای خراب شدن بی‌صدای پردازش آپدیت‌ها، ربات اجرا نمی‌شود
+SUPPORTED_PTB_VERSION = "20.0"
+if telegram.__version__ != SUPPORTED_PTB_VERSION:
+    raise RuntimeError(
+        f"ChatOrderedApplication requires python-telegram-bot=={SUPPORTED_PTB_VERSION}, "
+        f"found {telegram.__version__}; review application.py before upgrading"
+    )
+
+from telegram.ext._application import _STOP_SIGNAL
+
+logger = logging.getLogger(__name__)
+
+# سقف آپدیت‌هایی که هم‌زمان پردازش می‌شوند (همه‌ی چت‌ها روی هم)
+MAX_CONCURRENT_UPDATES = 64
+# worker چتی که این مدت (ثانیه) آپدیتی نداشته باشد بسته می‌شود
+CHAT_IDLE_TIMEOUT = 30.0
+
+
+class ChatOrderedApplication(Application):
+    """
+    Application که همراه با concurrent_updates استفاده می‌شود: یک عملیات کند در یک چت
+    بقیه‌ی چت‌ها را معطل نمی‌کند، اما آپدیت‌های یک چت همچنان به ترتیب و یکی‌یکی پردازش
+    می‌شوند تا وضعیت ConversationHandlerها به هم نریزد.
+
+    هر چت یک صف و یک worker دارد و worker فقط هنگام پردازش یک آپدیت، یکی از
+    MAX_CONCURRENT_UPDATES جای سراسری را می‌گیرد؛ آپدیت‌هایی که پشت یک چت شلوغ منتظرند
+    هیچ جای سراسری اشغال نمی‌کنند.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._chat_queues: Dict[int, "asyncio.Queue[object]"] = {}
+        self._chat_workers: Dict[int, "asyncio.Task[None]"] = {}
+
+    async def _update_fetcher(self) -> None:
+        if not self.concurrent_updates:
+            await super()._update_fetcher()
+            return
+
+        while True:
+            update = await self.update_queue.get()
+
+            if update is _STOP_SIGNAL:
+                # مثل PTB: آپدیت‌های دریافت‌نشده دور ریخته می‌شوند، آپدیت‌های صف چت‌ها پردازش می‌شوند
+                while not self.update_queue.empty():
+                    self.update_queue.get_nowait()
+                    self.update_queue.task_done()
+                self.update_queue.task_done()
+                await self._stop_chat_workers()
+                return
+
+            chat = update.effective_chat if isinstance(update, Update) else None
+            if chat is None:
+                self.create_task(self._process_with_slot(update), update=update)
+                continue
+
+            queue = self._chat_queues.get(chat.id)
+            if queue is None:
+                queue = self._chat_queues[chat.id] = asyncio.Queue()
+                self._chat_workers[chat.id] = asyncio.create_task(self._chat_worker(chat.id, queue))
+            queue.put_nowait(update)
+
+    async def _process_with_slot(self, update: object) -> None:
+        """آپدیت را با گرفتن یک جای سراسری پردازش می‌کند."""
+        try:
+            async with self._concurrent_updates_sem:
+                await self.process_update(update)
+        finally:
+            self.update_queue.task_done()
+
+    async def _chat_worker(self, chat_id: int, queue: "asyncio.Queue[object]") -> None:
+        """آپدیت‌های یک چت را به ترتیب پردازش می‌کند و پس از CHAT_IDLE_TIMEOUT بیکاری بسته می‌شود."""
+        try:
+            while True:
+                try:
+                    update = await asyncio.wait_for(queue.get(), CHAT_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    # بین wait_for و این خط await نیست؛ پس آپدیت جدیدی در صف نیامده است
+                    if queue.empty():
+                        return
+                    continue
+                try:
+                    await self._process_with_slot(update)
+                except Exception as e:
+                    logger.error(f"Error processing update for chat {chat_id}: {e}")
+                finally:
+                    queue.task_done()
+        finally:
+            del self._chat_queues[chat_id]
+            del self._chat_workers[chat_id]
+
+    async def _stop_chat_workers(self) -> None:
+        """صبر می‌کند تا صف همه‌ی چت‌ها خالی شود و سپس workerها را می‌بندد."""
+        await asyncio.gather(*(queue.join() for queue in list(self._chat_queues.values())))
+        workers = list(self._chat_workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        # پیام‌هایی که هنوز در صف گروه‌ها مانده‌اند قبل از بسته شدن اتصال ربات ارسال می‌شوند
+        await drain_group_queues()
+        await super().shutdown()
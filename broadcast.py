@@ -0,0 +1,219 @@
+# broadcast.py
+# ارسال هم‌زمان پیام به تعداد زیادی کاربر با رعایت محدودیت نرخ تلگرام
+import asyncio
+import time
+import logging
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterable, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from telegram import Bot, Message
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# سقف پیام‌های هم‌زمان در حال ارسال
+MAX_IN_FLIGHT = 25
+# ظرفیت صف بین خواندن گیرندگان از دیتابیس و ارسال‌کننده‌ها
+QUEUE_SIZE = 100
+# حداکثر طول متن یک پیام تلگرام
+MAX_MESSAGE_LENGTH = 4096
+# پیام‌هایی که در این بازه (ثانیه) به صف یک گروه می‌رسند در یک پیام ادغام می‌شوند
+COALESCE_WINDOW = 2.0
+
+
+class AsyncRateLimiter:
+    """محدودکننده‌ی نرخ به روش token bucket: حداکثر max_rate عملیات در هر period ثانیه."""
+
+    def __init__(self, max_rate: float, period: float = 1.0):
+        self.max_rate = max_rate
+        self.period = period
+        self._tokens = float(max_rate)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.max_rate,
+                    self._tokens + (now - self._updated_at) * self.max_rate / self.period
+                )
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.max_rate)
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
+
+
+# محدودیت سراسری ربات در تلگرام: ۳۰ پیام در ثانیه
+telegram_limiter = AsyncRateLimiter(30, 1.0)
+# محدودیت تلگرام برای هر گروه: ۲۰ پیام در دقیقه (یک محدودکننده برای هر chat_id)
+_group_limiters: Dict[int, AsyncRateLimiter] = defaultdict(lambda: AsyncRateLimiter(20, 60.0))
+
+
+@asynccontextmanager
+async def group_rate_limit(chat_id: int):
+    """ارسال به یک گروه را هم زیر سقف همان گروه و هم زیر سقف سراسری نگه می‌دارد."""
+    async with _group_limiters[chat_id], telegram_limiter:
+        yield
+
+
+async def _send_one(bot: Bot, chat_id: int, text: str, reply_markup=None) -> bool:
+    """یک پیام را ارسال می‌کند؛ در صورت RetryAfter یک بار دیگر تلاش می‌کند."""
+    for attempt in range(2):
+        try:
+            async with telegram_limiter:
+                await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+            return True
+        except RetryAfter as e:
+            if attempt:
+                raise
+            await asyncio.sleep(e.retry_after)
+    return False
+
+
+def _log_failures(failed: List[Tuple[int, Exception]], total: int) -> None:
+    """خطاهای ارسال را به‌جای یک لاگ برای هر کاربر، در یک خط خلاصه می‌کند."""
+    if not failed:
+        return
+    sample = ", ".join(f"{chat_id}: {error}" for chat_id, error in failed[:3])
+    logger.warning(f"Failed to send {len(failed)}/{total} messages (e.g. {sample})")
+    if logger.isEnabledFor(logging.DEBUG):
+        for chat_id, error in failed[3:]:
+            logger.debug(f"Failed to send message to user {chat_id}: {error}")
+
+
+async def send_bulk(bot: Bot, chat_ids: Iterable[int], text: str, reply_markup=None,
+                    max_in_flight: Optional[int] = None) -> int:
+    """پیام را هم‌زمان به همه‌ی chat_ids می‌فرستد و تعداد ارسال‌های موفق را برمی‌گرداند."""
+    semaphore = asyncio.Semaphore(max_in_flight or MAX_IN_FLIGHT)
+    chat_ids = list(chat_ids)
+
+    async def send(chat_id: int) -> bool:
+        async with semaphore:
+            return await _send_one(bot, chat_id, text, reply_markup)
+
+    results = await asyncio.gather(*(send(chat_id) for chat_id in chat_ids), return_exceptions=True)
+    failed = [(chat_id, result) for chat_id, result in zip(chat_ids, results) if isinstance(result, Exception)]
+    _log_failures(failed, len(chat_ids))
+    return sum(result is True for result in results)
+
+
+async def send_stream(bot: Bot, chat_ids: AsyncIterable[int], text: str, reply_markup=None,
+                      workers: Optional[int] = None) -> int:
+    """
+    گیرندگان را از یک منبع async (مثلاً cursor دیتابیس) می‌خواند و از طریق صف محدود
+    به چند worker می‌دهد؛ کل لیست گیرندگان هرگز در حافظه ساخته نمی‌شود.
+    """
+    workers = workers or MAX_IN_FLIGHT
+    queue: "asyncio.Queue[Optional[int]]" = asyncio.Queue(maxsize=QUEUE_SIZE)
+    sent_count = 0
+    total = 0
+    failed: List[Tuple[int, Exception]] = []
+
+    async def produce() -> None:
+        nonlocal total
+        try:
+            async for chat_id in chat_ids:
+                total += 1
+                await queue.put(chat_id)
+        finally:
+            for _ in range(workers):
+                await queue.put(None)
+
+    async def consume() -> None:
+        nonlocal sent_count
+        while (chat_id := await queue.get()) is not None:
+            try:
+                if await _send_one(bot, chat_id, text, reply_markup):
+                    sent_count += 1
+            except Exception as e:
+                failed.append((chat_id, e))
+
+    await asyncio.gather(produce(), *(consume() for _ in range(workers)))
+    _log_failures(failed, total)
+    return sent_count
+
+
+# همه‌ی صف‌های ساخته‌شده، برای ارسال پیام‌های باقی‌مانده هنگام توقف ربات
+_group_queues: List["GroupMessageQueue"] = []
+
+
+class GroupMessageQueue:
+    """
+    صف پیام‌های متنی یک گروه: put فقط پیام را در صف می‌گذارد و یک تسک پس‌زمینه آن را زیر
+    محدودیت نرخ گروه ارسال می‌کند. پیام‌هایی که در COALESCE_WINDOW ثانیه کنار هم می‌رسند
+    (تا سقف طول پیام تلگرام) در یک پیام ادغام می‌شوند.
+    بعد از هر ارسال، on_sent(message, metas) با metaهای پیام‌های ادغام‌شده فراخوانی می‌شود.
+    """
+
+    def __init__(self, chat_id: int,
+                 on_sent: Optional[Callable[[Message, List[Any]], Awaitable[None]]] = None,
+                 window: float = COALESCE_WINDOW):
+        self.chat_id = chat_id
+        self.on_sent = on_sent
+        self.window = window
+        self._pending: Deque[Tuple[str, Any]] = deque()
+        self._task: Optional["asyncio.Task[None]"] = None
+        _group_queues.append(self)
+
+    def put(self, bot: Bot, text: str, meta: Any = None) -> None:
+        self._pending.append((text, meta))
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run(bot))
+
+    async def drain(self) -> None:
+        """تا ارسال همه‌ی پیام‌های در صف صبر می‌کند."""
+        if self._task is not None:
+            await self._task
+
+    def _next_batch(self) -> Tuple[str, List[Any]]:
+        texts, metas = [], []
+        length = 0
+        while self._pending:
+            text, meta = self._pending[0]
+            if texts and length + len(text) > MAX_MESSAGE_LENGTH:
+                break
+            self._pending.popleft()
+            texts.append(text)
+            metas.append(meta)
+            # دو کاراکتر برای "\n\n" بین پیام‌ها
+            length += len(text) + 2
+        return "\n\n".join(texts), metas
+
+    async def _run(self, bot: Bot) -> None:
+        try:
+            while self._pending:
+                await asyncio.sleep(self.window)
+                text, metas = self._next_batch()
+                message = await self._send(bot, text)
+                if message is not None and self.on_sent is not None:
+                    try:
+                        await self.on_sent(message, metas)
+                    except Exception as e:
+                        logger.error(f"Error in on_sent callback for chat {self.chat_id}: {e}")
+        finally:
+            self._task = None
+
+    async def _send(self, bot: Bot, text: str) -> Optional[Message]:
+        while True:
+            try:
+                async with group_rate_limit(self.chat_id):
+                    return await bot.send_message(self.chat_id, text)
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.error(f"Failed to send queued message to chat {self.chat_id}: {e}")
+                return None
+
+
+async def drain_group_queues() -> None:
+    """پیام‌های در صف همه‌ی GroupMessageQueueها را ارسال می‌کند (قبل از توقف ربات)."""
+    await asyncio.gather(*(queue.drain() for queue in _group_queues))
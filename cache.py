@@ -0,0 +1,55 @@
+# cache.py
+# کش ساده‌ی درون‌پروسه‌ای با انقضای زمانی برای نتایج توابع async
+import time
+import functools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class AsyncTTLCache:
+    """کش LRU با TTL؛ به‌عنوان decorator روی توابع async تک‌آرگومانی هم قابل استفاده است."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __call__(self, func: Callable[[Hashable], Awaitable[Any]]) -> Callable[[Hashable], Awaitable[Any]]:
+        """نتیجه‌ی func را بر اساس تنها آرگومانش کش می‌کند؛ نتیجه‌ی None کش نمی‌شود."""
+        @functools.wraps(func)
+        async def wrapper(key: Hashable) -> Optional[Any]:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            value = await func(key)
+            if value is not None:
+                self.set(key, value)
+            return value
+
+        wrapper.cache = self
+        return wrapper
@@ -1,9 +1,13 @@
+import os
+import time
+import asyncio
 import aiosqlite
 import logging
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from typing import Optional, List, Any
-from config import DB_PATH
+from typing import Optional, List, Dict, Tuple, Any, AsyncIterator
+from config import DB_PATH, FEEDBACK_WINDOW_DAYS
+from cache import AsyncTTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +17,9 @@ ALLOWED_UPDATE_FIELDS = {
     'capacity', 'hashtag', 'type', 'is_active'
 }
 
+# فیلدهای پروفایل که کاربر می‌تواند ویرایش کند
+ALLOWED_USER_FIELDS = {'full_name', 'national_id', 'student_id', 'phone'}
+
 SQL_SCHEMAS = {
     'users': """
         CREATE TABLE IF NOT EXISTS users (
@@ -21,7 +28,7 @@ SQL_SCHEMAS = {
             national_id TEXT,
             student_id TEXT,
             phone TEXT,
-            created_at TEXT NOT NULL
+            created_at REAL NOT NULL
         )
     """,
     'events': """
@@ -39,7 +46,10 @@ SQL_SCHEMAS = {
             cost INTEGER DEFAULT 0,
             card_number TEXT,
             deactivation_reason TEXT,
-            feedback_sent_at TEXT
+            feedback_sent_at REAL,
+            feedback_deadline REAL,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0
         )
     """,
     'registrations': """
@@ -47,7 +57,7 @@ SQL_SCHEMAS = {
             registration_id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             event_id INTEGER NOT NULL,
-            registered_at TEXT NOT NULL,
+            registered_at REAL NOT NULL,
             FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
             FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE,
             UNIQUE(user_id, event_id)
@@ -73,14 +83,16 @@ SQL_SCHEMAS = {
     """,
     'operator_messages': """
         CREATE TABLE IF NOT EXISTS operator_messages (
-            message_id INTEGER PRIMARY KEY,
+            log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER NOT NULL,
             chat_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
+            user_id INTEGER,
             event_id INTEGER,
             message_type TEXT,
             sent_at TEXT NOT NULL,
             FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-            FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE
+            FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE,
+            UNIQUE(message_id, user_id, event_id)
         )
     """,
     'event_ratings': """
@@ -89,7 +101,7 @@ SQL_SCHEMAS = {
             user_id INTEGER NOT NULL,
             event_id INTEGER NOT NULL,
             rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5),
-            submitted_at TEXT NOT NULL,
+            submitted_at REAL NOT NULL,
             FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
             FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE,
             UNIQUE(user_id, event_id)
@@ -97,114 +109,539 @@ SQL_SCHEMAS = {
     """
 }
 
+SQL_INDEXES = {
+    # user_id در ایندکس است تا لیست شرکت‌کنندگان فقط از ایندکس خوانده شود
+    'idx_reg_event_user': "CREATE INDEX IF NOT EXISTS idx_reg_event_user ON registrations(event_id, user_id)",
+    'idx_ratings_event': "CREATE INDEX IF NOT EXISTS idx_ratings_event ON event_ratings(event_id)",
+    'idx_payments_user_event': "CREATE INDEX IF NOT EXISTS idx_payments_user_event ON payments(user_id, event_id)",
+    # ترتیب ستون‌ها مطابق شرط WHERE در get_recently_finished_events؛ title و type هم
+    # در ایندکس هستند تا کوئری بدون مراجعه به جدول اصلی (covering) پاسخ داده شود
+    'idx_events_feedback_cover': (
+        "CREATE INDEX IF NOT EXISTS idx_events_feedback_cover "
+        "ON events(is_active, feedback_sent_at, date, title, type)"
+    ),
+}
 
-@asynccontextmanager
-async def get_db_connection():
-    """Context manager برای اتصال امن به پایگاه داده."""
-    conn = await aiosqlite.connect(DB_PATH)
+# نسخه‌ی ساختار پایگاه داده (PRAGMA user_version) پس از اجرای _ensure_columns
+SCHEMA_VERSION = 7
+
+# ستون‌های زمانی که به‌صورت ثانیه‌ی Unix (time.time()) ذخیره می‌شوند
+EPOCH_COLUMNS = (
+    ('users', 'created_at'),
+    ('events', 'feedback_sent_at'),
+    ('registrations', 'registered_at'),
+    ('event_ratings', 'submitted_at'),
+)
+
+# ایندکس‌هایی که با نسخه‌ی بهتری جایگزین شده‌اند
+OBSOLETE_INDEXES = ('idx_events_feedback', 'idx_reg_event')
+
+
+# --- کوئری‌های پرتکرار ---
+# رشته‌های ثابت ماژول تا کش statement در sqlite3 همیشه به آن‌ها برخورد کند
+STATEMENT_CACHE_SIZE = 256
+
+# ستون‌ها دقیقاً همان‌هایی هستند که هندلرها استفاده می‌کنند (به‌جای SELECT *)
+_USER_COLUMNS = "user_id, full_name, national_id, student_id, phone"
+_EVENT_COLUMNS = (
+    "event_id, title, type, date, location, capacity, current_capacity, "
+    "description, is_active, hashtag, cost, deactivation_reason, "
+    # پیشوند هشتگ پیام‌های گروه اپراتورها یک بار در SQL ساخته و همراه رویداد کش می‌شود
+    "'#' || type || ' #' || replace(hashtag, ' ', '_') AS hashtag_prefix"
+)
+# لیست رویدادها فقط برای ساخت دکمه‌ها استفاده می‌شود
+_EVENT_LIST_COLUMNS = "event_id, title, type, date, is_active"
+
+_Q_GET_USER = f"SELECT {_USER_COLUMNS} FROM users WHERE user_id = ?"
+_Q_ALL_USER_IDS = "SELECT user_id FROM users"
+# دکمه‌ی تأیید تکراری نادیده گرفته می‌شود
+_Q_CREATE_USER = """
+    INSERT OR IGNORE INTO users (user_id, full_name, national_id, student_id, phone, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_Q_ALL_ADMIN_IDS = "SELECT user_id FROM admins"
+_Q_GET_EVENT = f"SELECT {_EVENT_COLUMNS} FROM events WHERE event_id = ?"
+_Q_CREATE_EVENT = """
+    INSERT INTO events (title, type, date, location, capacity, description, is_active, hashtag, cost, card_number)
+    VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+"""
+_Q_ALL_EVENTS = f"SELECT {_EVENT_LIST_COLUMNS} FROM events ORDER BY date DESC"
+_Q_ACTIVE_EVENTS = f"SELECT {_EVENT_LIST_COLUMNS} FROM events WHERE is_active = 1 ORDER BY date DESC"
+# فقط ستون‌های لازم برای برچسب دکمه‌ها، به‌صورت تاپل خام
+_Q_EVENT_LABELS = "SELECT event_id, title, type FROM events ORDER BY date DESC"
+_Q_UPDATE_EVENT_FIELD = {
+    field: f"UPDATE events SET {field} = ? WHERE event_id = ?"
+    for field in ALLOWED_UPDATE_FIELDS
+}
+_Q_FINISHED_EVENTS = """
+    SELECT event_id, title, type, date 
+    FROM events
+    WHERE date <= ? AND is_active = 0 AND feedback_sent_at IS NULL
+    ORDER BY date DESC
+"""
+_Q_EVENT_PARTICIPANTS = "SELECT user_id FROM registrations WHERE event_id = ?"
+# نام و تلفن شرکت‌کنندگان با یک JOIN (به ترتیب ثبت‌نام) برای لیست نهایی اپراتورها
+_Q_EVENT_ROSTER = """
+    SELECT u.full_name, u.phone FROM registrations r JOIN users u ON u.user_id = r.user_id
+    WHERE r.event_id = ? ORDER BY r.registered_at
+"""
+_Q_SET_FEEDBACK_SENT = "UPDATE events SET feedback_sent_at = ?, feedback_deadline = ? WHERE event_id = ?"
+_Q_FEEDBACK_STATUS = "SELECT feedback_deadline FROM events WHERE event_id = ?"
+_Q_PREVIOUS_RATING = "SELECT rating FROM event_ratings WHERE user_id = ? AND event_id = ?"
+# فقط وقتی ثبت می‌شود که نظرسنجی ارسال شده و مهلت آن تمام نشده باشد
+_Q_STORE_RATING_IF_OPEN = """
+    INSERT INTO event_ratings (user_id, event_id, rating, submitted_at)
+    SELECT ?, ?, ?, ?
+    WHERE EXISTS (
+        SELECT 1 FROM events
+        WHERE event_id = ? AND feedback_deadline >= ?
+    )
+    ON CONFLICT(user_id, event_id) DO UPDATE SET
+        rating = excluded.rating,
+        submitted_at = excluded.submitted_at
+"""
+_Q_ADD_TO_RATING_AGGREGATE = """
+    UPDATE events SET rating_sum = rating_sum + ?, rating_count = rating_count + ?
+    WHERE event_id = ?
+"""
+_Q_REGISTER_IGNORE = """
+    INSERT OR IGNORE INTO registrations (user_id, event_id, registered_at) VALUES (?, ?, ?)
+"""
+# ظرفیت فقط وقتی افزایش می‌یابد که جای خالی باشد (دوره‌ها ظرفیت نامحدود دارند)؛
+# current_capacity همان تعداد ثبت‌نام‌هاست و مقدار برگشتی شماره‌ی این ثبت‌نام است
+_Q_TAKE_SEAT = """
+    UPDATE events SET current_capacity = current_capacity + 1
+    WHERE event_id = ? AND (type = 'دوره' OR current_capacity < capacity)
+    RETURNING type, current_capacity, capacity
+"""
+_Q_IS_REGISTERED = "SELECT 1 FROM registrations WHERE user_id = ? AND event_id = ? LIMIT 1"
+_Q_INSERT_PAYMENT = "INSERT INTO payments (user_id, event_id, amount, confirmed_at) VALUES (?, ?, ?, ?)"
+_Q_DEACTIVATE_EVENT = "UPDATE events SET is_active = 0, deactivation_reason = ? WHERE event_id = ?"
+_Q_ACTIVATE_EVENT = """
+    UPDATE events SET is_active = 1, deactivation_reason = ''
+    WHERE event_id = ? AND is_active = 0 RETURNING event_id
+"""
+_Q_LOG_OPERATOR_MESSAGE = """
+    INSERT INTO operator_messages (message_id, chat_id, user_id, event_id, message_type, sent_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+_Q_UPDATE_USER_FIELD = {
+    field: f"UPDATE users SET {field} = ? WHERE user_id = ?"
+    for field in ALLOWED_USER_FIELDS
+}
+# میانگین از ستون‌های تجمیعی خوانده می‌شود، نه با AVG روی event_ratings
+_Q_EVENT_RATINGS = """
+    SELECT 
+        rating_sum * 1.0 / NULLIF(rating_count, 0) as avg_rating, 
+        rating_count as num_ratings 
+    FROM events 
+    WHERE event_id = ?
+"""
+
+# کش نتایج پرتکرار؛ بعد از هر تغییر در رویداد/کاربر باید invalidate شوند
+_event_cache = AsyncTTLCache(maxsize=512, ttl=60)
+_user_cache = AsyncTTLCache(maxsize=512, ttl=300)
+# لیست رویدادها برای کیبوردهای ادمین؛ کلید: active_only
+_events_list_cache = AsyncTTLCache(maxsize=2, ttl=30)
+
+# تنظیمات هر اتصال (این PRAGMAها per-connection هستند و روی هر اتصال اعمال می‌شوند)
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys=ON;",
+    "PRAGMA synchronous=NORMAL;",       # در حالت WAL امن است و fsync کمتری دارد
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA cache_size=-20000;",        # حدود 20MB کش صفحه
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA mmap_size=268435456;",      # 256MB
+)
+
+# تعداد اتصال‌های فقط‌خواندنی؛ WAL اجازه‌ی خواندن هم‌زمان را می‌دهد
+READ_POOL_SIZE = os.cpu_count() or 4
+
+# یک اتصال نویسنده (در init_db ساخته می‌شود) و صفی از اتصال‌های فقط‌خواندنی
+_writer: Optional[aiosqlite.Connection] = None
+_read_pool: Optional["asyncio.Queue[aiosqlite.Connection]"] = None
+# SQLite در هر لحظه فقط یک نویسنده می‌پذیرد
+_write_lock = asyncio.Lock()
+# تلاش‌های گرفتن قفل فایل وقتی busy_timeout کافی نبوده (مثلاً پروسه‌ی دیگری روی فایل می‌نویسد)
+WRITE_LOCK_ATTEMPTS = 3
+WRITE_LOCK_BACKOFF = 0.05
+
+# لاگ پیام‌های گروه اپراتورها به‌جای یک commit برای هر پیام، با تأخیر کوتاه و دسته‌ای ثبت می‌شود
+OPERATOR_LOG_FLUSH_DELAY = 1.0
+_operator_log: List[Tuple[int, int, Optional[int], int, str, str]] = []
+_operator_log_task: Optional["asyncio.Task[None]"] = None
+
+
+async def _connect(database: str, **kwargs: Any) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(database, cached_statements=STATEMENT_CACHE_SIZE, **kwargs)
     conn.row_factory = aiosqlite.Row
+    # همه‌ی PRAGMAها با یک فراخوانی (یک رفت‌وبرگشت به thread اتصال) اعمال می‌شوند
+    await conn.executescript("\n".join(CONNECTION_PRAGMAS))
+    return conn
+
+
+@asynccontextmanager
+async def read_conn():
+    """یک اتصال فقط‌خواندنی از pool قرض می‌دهد و در پایان برمی‌گرداند."""
+    if _read_pool is None:
+        raise RuntimeError("Database is not initialized; call init_db() first")
+    conn = await _read_pool.get()
     try:
         yield conn
     finally:
-        await conn.close()
+        _read_pool.put_nowait(conn)
+
+
+@asynccontextmanager
+async def write_conn():
+    """اتصال نویسنده را پشت قفل نوشتن برمی‌گرداند؛ در صورت خطا تراکنش باز را rollback می‌کند."""
+    if _writer is None:
+        raise RuntimeError("Database is not initialized; call init_db() first")
+    async with _write_lock:
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.rollback()
+            raise
+
+
+def _is_busy_error(error: aiosqlite.Error) -> bool:
+    """خطای «database is locked/busy» را از بقیه‌ی OperationalErrorها جدا می‌کند."""
+    message = str(error).lower()
+    return isinstance(error, aiosqlite.OperationalError) and ("locked" in message or "busy" in message)
+
+
+async def _begin_immediate(conn: aiosqlite.Connection) -> None:
+    """
+    BEGIN IMMEDIATE را اجرا می‌کند و اگر قفل فایل در مهلت busy_timeout آزاد نشده باشد، با تأخیر
+    افزایشی دوباره تلاش می‌کند. در حالت WAL با یک اتصال نویسنده، خطای busy فقط در همین
+    نقطه رخ می‌دهد؛ پس تکرار کل تراکنش (یا هندلر و پیام‌هایش) لازم نیست.
+    """
+    for attempt in range(WRITE_LOCK_ATTEMPTS):
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+            return
+        except aiosqlite.OperationalError as e:
+            if attempt == WRITE_LOCK_ATTEMPTS - 1 or not _is_busy_error(e):
+                raise
+            logger.warning(f"Database is busy, retrying write transaction ({attempt + 1}/{WRITE_LOCK_ATTEMPTS})")
+            await asyncio.sleep(WRITE_LOCK_BACKOFF * 2 ** attempt)
+
+
+@asynccontextmanager
+async def write_tx(conn: aiosqlite.Connection):
+    """تراکنش نوشتن را با BEGIN IMMEDIATE شروع می‌کند تا قفل نوشتن از ابتدا گرفته شود."""
+    await _begin_immediate(conn)
+    try:
+        yield conn
+    except BaseException:
+        await conn.rollback()
+        raise
+    else:
+        await conn.commit()
 
 
 async def init_db() -> None:
     """پایگاه داده را با تمام جداول لازم راه‌اندازی می‌کند."""
-    async with get_db_connection() as conn:
+    global _writer, _read_pool
+    if _writer is None:
+        _writer = await _connect(DB_PATH, isolation_level="IMMEDIATE")
+
+    async with write_conn() as conn:
         try:
-            # تنظیمات پایگاه داده
-            await conn.execute("PRAGMA journal_mode=WAL;")
-            await conn.execute("PRAGMA foreign_keys=ON;")
+            # تنظیمات پایگاه داده و ایجاد تمام جداول در یک اسکریپت (یک رفت‌وبرگشت)
+            await conn.executescript(
+                ";\n".join(["PRAGMA journal_mode=WAL", *SQL_SCHEMAS.values()]) + ";"
+            )
+            logger.info(f"Tables initialized successfully: {', '.join(SQL_SCHEMAS)}")
             
-            # ایجاد تمام جداول
-            for table_name, schema in SQL_SCHEMAS.items():
-                await conn.execute(schema)
-                logger.info(f"Table '{table_name}' initialized successfully")
+            # مهاجرت ستون‌ها فقط برای پایگاه داده‌هایی با نسخه‌ی قدیمی‌تر اجرا می‌شود
+            async with conn.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            if version < SCHEMA_VERSION:
+                await _ensure_columns(conn)
             
-            await conn.commit()
-            await _ensure_columns(conn)
+            # ایندکس‌ها بعد از _ensure_columns ساخته می‌شوند تا ستون‌های جدید موجود باشند
+            await conn.executescript(";\n".join([
+                *(f"DROP INDEX IF EXISTS {name}" for name in OBSOLETE_INDEXES),
+                *SQL_INDEXES.values(),
+            ]) + ";")
             
         except aiosqlite.Error as e:
             logger.error(f"Error initializing database: {e}")
             raise
 
+    # اتصال‌های خواندنی بعد از ساخت فایل و جداول باز می‌شوند
+    if _read_pool is None:
+        pool: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        for _ in range(READ_POOL_SIZE):
+            pool.put_nowait(await _connect(f"file:{DB_PATH}?mode=ro", uri=True))
+        _read_pool = pool
+
+
+async def close_db() -> None:
+    """تمام اتصال‌های پایگاه داده را هنگام خاموش شدن ربات می‌بندد."""
+    global _writer, _read_pool
+    # لاگ‌های در انتظار قبل از بستن اتصال نویسنده ذخیره می‌شوند؛ تسک ذخیره‌ی تأخیری لغو نمی‌شود
+    # (ممکن است ردیف‌ها را از صف برداشته و منتظر قفل نوشتن باشد) و تا پایان کارش صبر می‌کنیم
+    if _operator_log_task is not None:
+        await asyncio.gather(_operator_log_task, return_exceptions=True)
+    if _writer is not None:
+        await flush_operator_log()
+    if _read_pool is not None:
+        while not _read_pool.empty():
+            await _read_pool.get_nowait().close()
+        _read_pool = None
+    if _writer is not None:
+        # نوشتنی که هنوز در جریان است قبل از بستن اتصال تمام می‌شود
+        async with _write_lock:
+            await _writer.close()
+            _writer = None
+    logger.info("Database connections closed")
+
 
 async def _ensure_columns(conn: aiosqlite.Connection) -> None:
-    """ستون‌های جدید را در صورت نیاز اضافه می‌کند."""
+    """
+    ستون‌های جدید را اضافه و جدول‌هایی را که نوع ستون‌هایشان قدیمی است بازسازی می‌کند. کل
+    مهاجرت یک تراکنش است؛ در صورت خطا هیچ تغییری باقی نمی‌ماند و خطا به init_db می‌رسد.
+    """
+    # حذف جدول والد با foreign_keys روشن ردیف‌های فرزند را cascade می‌کند؛ این PRAGMA
+    # داخل تراکنش اثری ندارد، پس قبل از BEGIN خاموش و بعد از پایان دوباره روشن می‌شود
+    await conn.execute("PRAGMA foreign_keys=OFF")
     try:
-        # بررسی و اضافه کردن ستون feedback_sent_at
-        async with conn.execute("PRAGMA table_info(events)") as cursor:
-            columns = {row[1] for row in await cursor.fetchall()}
-        
-        if 'feedback_sent_at' not in columns:
-            await conn.execute("ALTER TABLE events ADD COLUMN feedback_sent_at TEXT;")
-            await conn.commit()
-            logger.info("Column 'feedback_sent_at' added to events table")
-            
+        async with write_tx(conn):
+            await _migrate(conn)
+        logger.info(f"Database schema migrated to version {SCHEMA_VERSION}")
     except aiosqlite.Error as e:
-        logger.error(f"Error ensuring columns: {e}")
+        logger.error(f"Error migrating database schema: {e}")
+        raise
+    finally:
+        await conn.execute("PRAGMA foreign_keys=ON")
+
 
+async def _table_columns(conn: aiosqlite.Connection, table: str) -> Dict[str, aiosqlite.Row]:
+    async with conn.execute(f"PRAGMA table_info({table})") as cursor:
+        return {row[1]: row for row in await cursor.fetchall()}
 
+
+async def _rebuild_table(conn: aiosqlite.Connection, table: str) -> None:
+    """
+    جدول را با تعریف فعلی SQL_SCHEMAS از نو می‌سازد (SQLite تغییر نوع ستون یا حذف NOT NULL را
+    با ALTER پشتیبانی نمی‌کند). ستون‌های زمانی با CAST به عدد تبدیل می‌شوند.
+    """
+    old_columns = await _table_columns(conn, table)
+    await conn.execute(
+        SQL_SCHEMAS[table].replace(f"CREATE TABLE IF NOT EXISTS {table}", f"CREATE TABLE {table}_new")
+    )
+    columns = [name for name in await _table_columns(conn, f"{table}_new") if name in old_columns]
+    epoch_columns = {column for t, column in EPOCH_COLUMNS if t == table}
+    select = ", ".join(f"CAST({c} AS REAL)" if c in epoch_columns else c for c in columns)
+    await conn.execute(
+        f"INSERT INTO {table}_new ({', '.join(columns)}) SELECT {select} FROM {table}"
+    )
+    await conn.execute(f"DROP TABLE {table}")
+    await conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    logger.info(f"Table '{table}' rebuilt with the current schema")
+
+
+async def _migrate(conn: aiosqlite.Connection) -> None:
+    columns = await _table_columns(conn, "events")
+
+    if 'feedback_sent_at' not in columns:
+        await conn.execute("ALTER TABLE events ADD COLUMN feedback_sent_at REAL;")
+        logger.info("Column 'feedback_sent_at' added to events table")
+
+    # ستون‌های تجمیعی امتیاز؛ برای داده‌های قبلی از event_ratings پر می‌شوند
+    if 'rating_sum' not in columns:
+        await conn.execute("ALTER TABLE events ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0;")
+        await conn.execute("ALTER TABLE events ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0;")
+        await conn.execute(
+            """
+            UPDATE events SET
+                rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM event_ratings r WHERE r.event_id = events.event_id),
+                rating_count = (SELECT COUNT(*) FROM event_ratings r WHERE r.event_id = events.event_id)
+            """
+        )
+        logger.info("Columns 'rating_sum', 'rating_count' added to events table")
+
+    # تبدیل مقادیر ISO قدیمی (زمان محلی) به ثانیه‌ی Unix
+    for table, column in EPOCH_COLUMNS:
+        await conn.execute(
+            f"UPDATE {table} SET {column} = unixepoch({column}, 'utc') "
+            f"WHERE {column} LIKE '____-__-__%'"
+        )
+
+    # مهلت نظرسنجی هنگام ارسال محاسبه و ذخیره می‌شود؛ برای داده‌های قبلی از feedback_sent_at
+    if 'feedback_deadline' not in columns:
+        await conn.execute("ALTER TABLE events ADD COLUMN feedback_deadline REAL;")
+        await conn.execute(
+            "UPDATE events SET feedback_deadline = feedback_sent_at + ? WHERE feedback_sent_at IS NOT NULL",
+            (FEEDBACK_WINDOW_DAYS * 86400,)
+        )
+        logger.info("Column 'feedback_deadline' added to events table")
+
+    # شماره‌ی ثبت‌نام از current_capacity خوانده می‌شود؛ مقادیر قبلی با تعداد واقعی هم‌گام می‌شوند
+    await conn.execute(
+        """
+        UPDATE events SET current_capacity =
+            (SELECT COUNT(*) FROM registrations r WHERE r.event_id = events.event_id)
+        """
+    )
+
+    # CREATE TABLE IF NOT EXISTS نوع ستون‌های پایگاه داده‌ی موجود را تغییر نمی‌دهد: ستون‌های
+    # زمانی TEXT قدیمی (که اعداد را هم متنی ذخیره می‌کنند) با بازسازی جدول REAL می‌شوند
+    rebuild = []
+    for table in dict.fromkeys(table for table, _ in EPOCH_COLUMNS):
+        table_columns = await _table_columns(conn, table)
+        if any(table_columns[c][2].upper() != 'REAL' for t, c in EPOCH_COLUMNS if t == table):
+            rebuild.append(table)
+    # user_id در operator_messages برای پیام‌هایی که به کاربر خاصی مربوط نیستند (لیست نهایی) NULL است
+    # و یک پیام ادغام‌شده برای هر ثبت‌نامش یک ردیف دارد (message_id دیگر کلید جدول نیست)
+    operator_columns = await _table_columns(conn, "operator_messages")
+    if 'log_id' not in operator_columns or operator_columns['user_id'][3]:
+        rebuild.append('operator_messages')
+    for table in rebuild:
+        await _rebuild_table(conn, table)
+
+    await conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def invalidate_event(event_id: int) -> None:
+    """کش جزئیات یک رویداد (و لیست رویدادها) را پس از تغییر آن پاک می‌کند."""
+    _event_cache.invalidate(event_id)
+    _events_list_cache.clear()
+
+
+def invalidate_events_list() -> None:
+    """کش لیست رویدادها را پس از اضافه شدن رویداد جدید پاک می‌کند."""
+    _events_list_cache.clear()
+
+
+def invalidate_user(user_id: int) -> None:
+    """کش اطلاعات یک کاربر را پس از ویرایش پروفایل پاک می‌کند."""
+    _user_cache.invalidate(user_id)
+
+
+@_user_cache
 async def get_user_info(user_id: int) -> Optional[aiosqlite.Row]:
     """اطلاعات کاربر را برمی‌گرداند."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
-            ) as cursor:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_GET_USER, (user_id,)) as cursor:
                 return await cursor.fetchone()
     except aiosqlite.Error as e:
         logger.error(f"Error fetching user {user_id}: {e}")
         return None
 
 
-async def get_admin_info(user_id: int) -> Optional[aiosqlite.Row]:
-    """اطلاعات ادمین را برمی‌گرداند."""
+async def get_all_admin_ids() -> Optional[set]:
+    """مجموعه‌ی شناسه‌ی ادمین‌های ثبت‌شده در دیتابیس؛ در صورت خطا None."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                "SELECT * FROM admins WHERE user_id = ?",
-                (user_id,)
-            ) as cursor:
-                return await cursor.fetchone()
+        async with read_conn() as conn:
+            async with conn.execute(_Q_ALL_ADMIN_IDS) as cursor:
+                cursor.row_factory = None
+                return {user_id async for (user_id,) in cursor}
+    except aiosqlite.Error as e:
+        logger.error(f"Error fetching admin ids: {e}")
+        return None
+
+
+async def create_user(user_id: int, full_name: str, national_id: str, student_id: str, phone: str) -> bool:
+    """پروفایل کاربر جدید را ذخیره می‌کند؛ اگر کاربر از قبل وجود داشته باشد تغییری نمی‌دهد."""
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            await conn.execute(_Q_CREATE_USER, (user_id, full_name, national_id, student_id, phone, time.time()))
+        invalidate_user(user_id)
+        return True
+    except aiosqlite.Error as e:
+        logger.error(f"Error creating user {user_id}: {e}")
+        return False
+
+
+async def create_event(title: str, event_type: str, date: str, location: str, capacity: int,
+                       description: str, hashtag: str, cost: int, card_number: str) -> Optional[int]:
+    """رویداد جدید (فعال) را ذخیره می‌کند و event_id آن را برمی‌گرداند؛ در صورت خطا None."""
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            cursor = await conn.execute(
+                _Q_CREATE_EVENT,
+                (title, event_type, date, location, capacity, description, hashtag, cost, card_number)
+            )
+            event_id = cursor.lastrowid
+        invalidate_events_list()
+        return event_id
     except aiosqlite.Error as e:
-        logger.error(f"Error fetching admin {user_id}: {e}")
+        logger.error(f"Error creating event {title}: {e}")
         return None
 
 
+@_event_cache
 async def get_event_details(event_id: int) -> Optional[aiosqlite.Row]:
     """جزئیات رویداد را برمی‌گرداند."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                "SELECT * FROM events WHERE event_id = ?",
-                (event_id,)
-            ) as cursor:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_GET_EVENT, (event_id,)) as cursor:
                 return await cursor.fetchone()
     except aiosqlite.Error as e:
         logger.error(f"Error fetching event {event_id}: {e}")
         return None
 
 
-async def get_all_events(active_only: bool = False) -> List[aiosqlite.Row]:
-    """تمام رویدادها را برمی‌گرداند."""
+async def iter_all_events(active_only: bool = False) -> AsyncIterator[aiosqlite.Row]:
+    """رویدادها را سطر به سطر برمی‌گرداند تا کل جدول یک‌جا در حافظه ساخته نشود."""
     try:
-        async with get_db_connection() as conn:
-            query = "SELECT * FROM events"
-            params = []
-            
-            if active_only:
-                query += " WHERE is_active = 1"
-            
-            query += " ORDER BY date DESC"
-            
-            async with conn.execute(query, params) as cursor:
-                return await cursor.fetchall()
+        async with read_conn() as conn:
+            query = _Q_ACTIVE_EVENTS if active_only else _Q_ALL_EVENTS
+            async with conn.execute(query) as cursor:
+                async for row in cursor:
+                    yield row
     except aiosqlite.Error as e:
         logger.error(f"Error fetching all events: {e}")
-        return []
+
+
+async def iter_event_labels() -> AsyncIterator[Tuple[int, str, str]]:
+    """(event_id, title, type) همه‌ی رویدادها را سطر به سطر برمی‌گرداند."""
+    try:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_EVENT_LABELS) as cursor:
+                cursor.row_factory = None
+                async for row in cursor:
+                    yield row
+    except aiosqlite.Error as e:
+        logger.error(f"Error fetching event labels: {e}")
+
+
+async def iter_user_ids() -> AsyncIterator[int]:
+    """شناسه‌ی همه‌ی کاربران را سطر به سطر برمی‌گرداند (برای ارسال همگانی)."""
+    try:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_ALL_USER_IDS) as cursor:
+                cursor.row_factory = None
+                async for (user_id,) in cursor:
+                    yield user_id
+    except aiosqlite.Error as e:
+        logger.error(f"Error streaming user ids: {e}")
+
+
+async def iter_event_participants(event_id: int) -> AsyncIterator[int]:
+    """شناسه‌ی شرکت‌کنندگان یک رویداد را سطر به سطر برمی‌گرداند (برای اعلان به گروه)."""
+    try:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_EVENT_PARTICIPANTS, (event_id,)) as cursor:
+                cursor.row_factory = None
+                async for (user_id,) in cursor:
+                    yield user_id
+    except aiosqlite.Error as e:
+        logger.error(f"Error streaming participants for event {event_id}: {e}")
+
+
+async def get_all_events(active_only: bool = False) -> List[aiosqlite.Row]:
+    """تمام رویدادها را برمی‌گرداند (۳۰ ثانیه کش می‌شود)."""
+    events = _events_list_cache.get(active_only)
+    if events is None:
+        events = [row async for row in iter_all_events(active_only)]
+        _events_list_cache.set(active_only, events)
+    return events
 
 
 async def update_event_field(event_id: int, field: str, value: Any) -> bool:
@@ -218,12 +655,11 @@ async def update_event_field(event_id: int, field: str, value: Any) -> bool:
         return False
     
     try:
-        async with get_db_connection() as conn:
-            query = f"UPDATE events SET {field} = ? WHERE event_id = ?"
-            await conn.execute(query, (value, event_id))
-            await conn.commit()
-            logger.info(f"Updated event {event_id}: {field} = {value}")
-            return True
+        async with write_conn() as conn, write_tx(conn):
+            await conn.execute(_Q_UPDATE_EVENT_FIELD[field], (value, event_id))
+        invalidate_event(event_id)
+        logger.info(f"Updated event {event_id}: {field} = {value}")
+        return True
     except aiosqlite.Error as e:
         logger.error(f"Error updating event {event_id} field {field}: {e}")
         return False
@@ -233,107 +669,261 @@ async def get_recently_finished_events() -> List[aiosqlite.Row]:
     """رویدادهای تمام‌شده‌ای که نظرسنجی برایشان ارسال نشده را برمی‌گرداند."""
     try:
         yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                """
-                SELECT event_id, title, type, date 
-                FROM events
-                WHERE date <= ? AND is_active = 0 AND feedback_sent_at IS NULL
-                ORDER BY date DESC
-                """,
-                (yesterday,)
-            ) as cursor:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_FINISHED_EVENTS, (yesterday,)) as cursor:
                 return await cursor.fetchall()
     except aiosqlite.Error as e:
         logger.error(f"Error fetching recently finished events: {e}")
         return []
 
 
-async def get_event_participants(event_id: int) -> List[aiosqlite.Row]:
-    """شرکت‌کنندگان یک رویداد را برمی‌گرداند."""
+async def get_event_roster(event_id: int) -> List[Tuple[str, str]]:
+    """(full_name, phone) همه‌ی شرکت‌کنندگان رویداد را با یک کوئری برمی‌گرداند."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                "SELECT user_id FROM registrations WHERE event_id = ?",
-                (event_id,)
-            ) as cursor:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_EVENT_ROSTER, (event_id,)) as cursor:
+                cursor.row_factory = None
                 return await cursor.fetchall()
     except aiosqlite.Error as e:
-        logger.error(f"Error fetching participants for event {event_id}: {e}")
+        logger.error(f"Error fetching roster for event {event_id}: {e}")
         return []
 
 
-async def set_feedback_sent(event_id: int) -> bool:
-    """زمان ارسال نظرسنجی را در دیتابیس ثبت می‌کند."""
+async def set_feedback_sent(event_id: int, deadline: float) -> bool:
+    """زمان ارسال نظرسنجی و مهلت امتیازدهی (ثانیه‌ی Unix) را در دیتابیس ثبت می‌کند."""
     try:
-        async with get_db_connection() as conn:
-            await conn.execute(
-                "UPDATE events SET feedback_sent_at = ? WHERE event_id = ?",
-                (datetime.now().isoformat(), event_id)
-            )
-            await conn.commit()
-            logger.info(f"Marked feedback as sent for event {event_id}")
-            return True
+        async with write_conn() as conn, write_tx(conn):
+            await conn.execute(_Q_SET_FEEDBACK_SENT, (time.time(), deadline, event_id))
+        logger.info(f"Marked feedback as sent for event {event_id}")
+        return True
     except aiosqlite.Error as e:
         logger.error(f"Error setting feedback_sent_at for event {event_id}: {e}")
         return False
 
 
-async def get_event_feedback_status(event_id: int) -> Optional[aiosqlite.Row]:
-    """وضعیت ارسال نظرسنجی رویداد را برمی‌گرداند."""
+async def get_event_feedback_status(event_id: int) -> Optional[float]:
+    """مهلت امتیازدهی (ثانیه‌ی Unix) را برمی‌گرداند؛ اگر نظرسنجی ارسال نشده باشد None."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                "SELECT feedback_sent_at FROM events WHERE event_id = ?",
-                (event_id,)
-            ) as cursor:
-                return await cursor.fetchone()
+        async with read_conn() as conn:
+            async with conn.execute(_Q_FEEDBACK_STATUS, (event_id,)) as cursor:
+                cursor.row_factory = None
+                row = await cursor.fetchone()
+        return float(row[0]) if row and row[0] is not None else None
     except aiosqlite.Error as e:
         logger.error(f"Error fetching feedback status for event {event_id}: {e}")
         return None
 
 
-async def store_rating(user_id: int, event_id: int, rating: int) -> bool:
-    """امتیاز کاربر را ثبت یا به‌روزرسانی می‌کند."""
+async def store_rating_if_open(user_id: int, event_id: int, rating: int) -> bool:
+    """امتیاز را فقط در صورت باز بودن مهلت نظرسنجی ثبت می‌کند؛ در غیر این صورت False برمی‌گرداند."""
     if not (1 <= rating <= 5):
         logger.warning(f"Invalid rating value: {rating}")
         return False
     
+    now = time.time()
     try:
-        async with get_db_connection() as conn:
-            await conn.execute(
-                """
-                INSERT INTO event_ratings (user_id, event_id, rating, submitted_at)
-                VALUES (?, ?, ?, ?)
-                ON CONFLICT(user_id, event_id) DO UPDATE SET
-                    rating = excluded.rating,
-                    submitted_at = excluded.submitted_at
-                """,
-                (user_id, event_id, rating, datetime.now().isoformat())
+        async with write_conn() as conn, write_tx(conn):
+            stored = await _upsert_rating(
+                conn, user_id, event_id, rating, _Q_STORE_RATING_IF_OPEN,
+                (user_id, event_id, rating, now, event_id, now)
             )
-            await conn.commit()
+        if stored:
             logger.info(f"Stored rating {rating} from user {user_id} for event {event_id}")
-            return True
+        return stored
     except aiosqlite.Error as e:
         logger.error(f"Error storing rating for user {user_id}, event {event_id}: {e}")
         return False
 
 
+async def _upsert_rating(conn: aiosqlite.Connection, user_id: int, event_id: int, rating: int,
+                         query: str, params: tuple) -> bool:
+    """امتیاز را درج/به‌روزرسانی و ستون‌های تجمیعی را در همان تراکنش اصلاح می‌کند."""
+    async with conn.execute(_Q_PREVIOUS_RATING, (user_id, event_id)) as cursor:
+        previous = await cursor.fetchone()
+    async with conn.execute(query, params) as cursor:
+        if cursor.rowcount == 0:
+            return False
+    # به‌روزرسانی افزایشی جمع و تعداد امتیازها در همان تراکنش
+    if previous is None:
+        delta_sum, delta_count = rating, 1
+    else:
+        delta_sum, delta_count = rating - previous['rating'], 0
+    await conn.execute(_Q_ADD_TO_RATING_AGGREGATE, (delta_sum, delta_count, event_id))
+    return True
+
+
+async def is_registered(user_id: int, event_id: int) -> bool:
+    """بررسی می‌کند کاربر در رویداد ثبت‌نام کرده است یا نه."""
+    try:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_IS_REGISTERED, (user_id, event_id)) as cursor:
+                return await cursor.fetchone() is not None
+    except aiosqlite.Error as e:
+        logger.error(f"Error checking registration of {user_id} for event {event_id}: {e}")
+        return False
+
+
+class _EventFull(Exception):
+    """ظرفیت رویداد پر است؛ فقط برای rollback تراکنش ثبت‌نام استفاده می‌شود."""
+
+
+# مقدار reg_count در register_user وقتی ظرفیت رویداد تکمیل شده باشد
+EVENT_FULL = -1
+
+
+async def register_user(user_id: int, event_id: int, amount: Optional[int] = None) -> Optional[Tuple[int, bool]]:
+    """
+    کاربر را در یک تراکنش ثبت‌نام می‌کند (و در صورت وجود amount پرداخت را هم ثبت می‌کند).
+    بررسی ظرفیت و افزایش آن در همان تراکنش و با یک UPDATE شرطی انجام می‌شود تا دو ثبت‌نام
+    هم‌زمان نتوانند از ظرفیت عبور کنند.
+    (reg_count, filled) را برمی‌گرداند: reg_count تعداد ثبت‌نام‌های رویداد است (0 اگر کاربر قبلاً
+    ثبت‌نام کرده باشد و EVENT_FULL اگر ظرفیت تکمیل باشد) و filled یعنی این ثبت‌نام ظرفیت را پر کرد.
+    در صورت خطا None برمی‌گرداند.
+    """
+    # زمان ثبت‌نام و پرداخت یکسان است (registered_at به ثانیه‌ی Unix و confirmed_at به ISO)
+    now = time.time()
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            cursor = await conn.execute(_Q_REGISTER_IGNORE, (user_id, event_id, now))
+            if cursor.rowcount == 0:
+                return 0, False
+            async with conn.execute(_Q_TAKE_SEAT, (event_id,)) as cursor:
+                seat = await cursor.fetchone()
+            if seat is None:
+                raise _EventFull()
+            if amount is not None:
+                await conn.execute(_Q_INSERT_PAYMENT, (user_id, event_id, amount, datetime.fromtimestamp(now).isoformat()))
+        invalidate_event(event_id)
+        event_type, reg_count, capacity = seat
+        return reg_count, event_type != "دوره" and reg_count >= capacity
+    except _EventFull:
+        invalidate_event(event_id)
+        return EVENT_FULL, False
+    except aiosqlite.Error as e:
+        logger.error(f"Error registering user {user_id} for event {event_id}: {e}")
+        return None
+
+
+async def set_event_inactive(event_id: int, reason: str) -> bool:
+    """رویداد را با ذکر دلیل غیرفعال می‌کند."""
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            await conn.execute(_Q_DEACTIVATE_EVENT, (reason, event_id))
+        invalidate_event(event_id)
+        return True
+    except aiosqlite.Error as e:
+        logger.error(f"Error deactivating event {event_id}: {e}")
+        return False
+
+
+async def set_event_active(event_id: int) -> bool:
+    """رویداد غیرفعال را فعال می‌کند؛ اگر رویداد فعال باشد یا وجود نداشته باشد False برمی‌گرداند."""
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            async with conn.execute(_Q_ACTIVATE_EVENT, (event_id,)) as cursor:
+                activated = await cursor.fetchone() is not None
+        if activated:
+            invalidate_event(event_id)
+        return activated
+    except aiosqlite.Error as e:
+        logger.error(f"Error activating event {event_id}: {e}")
+        return False
+
+
+async def log_operator_message(message_id: int, chat_id: int, user_id: Optional[int], event_id: int, message_type: str) -> None:
+    """پیام ارسال‌شده به گروه اپراتورها را برای ثبت در صف می‌گذارد."""
+    await log_operator_messages([(message_id, chat_id, user_id, event_id, message_type)])
+
+
+async def log_operator_messages(rows: List[Tuple[int, int, Optional[int], int, str]]) -> None:
+    """
+    چند پیام گروه اپراتورها (message_id, chat_id, user_id, event_id, message_type) را در صف
+    می‌گذارد؛ پیام‌هایی که در فاصله‌ی OPERATOR_LOG_FLUSH_DELAY ثانیه می‌رسند با یک executemany
+    و یک commit ذخیره می‌شوند.
+    """
+    global _operator_log_task
+    sent_at = datetime.now().isoformat()
+    _operator_log.extend((*row, sent_at) for row in rows)
+    if _operator_log and _operator_log_task is None:
+        _operator_log_task = asyncio.get_running_loop().create_task(_flush_operator_log_later())
+
+
+async def _flush_operator_log_later() -> None:
+    global _operator_log_task
+    try:
+        # ردیف‌هایی که حین نوشتن دسته‌ی قبلی می‌رسند در دور بعدی همین تسک ذخیره می‌شوند؛
+        # مرجع تسک تا پایان نوشتن نگه داشته می‌شود تا close_db بتواند منتظرش بماند
+        while _operator_log:
+            await asyncio.sleep(OPERATOR_LOG_FLUSH_DELAY)
+            await flush_operator_log()
+    finally:
+        _operator_log_task = None
+
+
+async def flush_operator_log() -> None:
+    """لاگ‌های در صف را در یک تراکنش ثبت می‌کند."""
+    rows = _operator_log[:]
+    _operator_log.clear()
+    if not rows:
+        return
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            await conn.executemany(_Q_LOG_OPERATOR_MESSAGE, rows)
+        return
+    except aiosqlite.Error as e:
+        if len(rows) == 1:
+            logger.error(f"Error logging operator message {rows[0][0]}: {e}")
+            return
+        logger.warning(f"Batch insert of {len(rows)} operator messages failed, retrying row by row: {e}")
+
+    # فقط برای شرایط غیرمنتظره (مثلاً ردیف تکراری)؛ در حالت عادی همه‌ی ردیف‌ها با executemany ثبت می‌شوند
+    for row in rows:
+        try:
+            async with write_conn() as conn, write_tx(conn):
+                await conn.execute(_Q_LOG_OPERATOR_MESSAGE, row)
+        except aiosqlite.Error as e:
+            logger.error(f"Error logging operator message {row[0]}: {e}")
+
+
+async def update_user_field(user_id: int, field: str, value: str) -> bool:
+    """یک فیلد پروفایل کاربر را به‌روزرسانی می‌کند."""
+    if field not in ALLOWED_USER_FIELDS:
+        logger.warning(f"Attempt to update non-allowed user field: {field}")
+        return False
+
+    try:
+        async with write_conn() as conn, write_tx(conn):
+            await conn.execute(_Q_UPDATE_USER_FIELD[field], (value, user_id))
+        invalidate_user(user_id)
+        return True
+    except aiosqlite.Error as e:
+        logger.error(f"Error updating user {user_id} field {field}: {e}")
+        return False
+
+
 async def get_event_ratings(event_id: int) -> Optional[aiosqlite.Row]:
     """میانگین و تعداد امتیازات یک رویداد را برمی‌گرداند."""
     try:
-        async with get_db_connection() as conn:
-            async with conn.execute(
-                """
-                SELECT 
-                    AVG(rating) as avg_rating, 
-                    COUNT(rating) as num_ratings 
-                FROM event_ratings 
-                WHERE event_id = ?
-                """,
-                (event_id,)
-            ) as cursor:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_EVENT_RATINGS, (event_id,)) as cursor:
                 return await cursor.fetchone()
     except aiosqlite.Error as e:
         logger.error(f"Error fetching ratings for event {event_id}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_event_with_participants(event_id: int) -> Tuple[Optional[aiosqlite.Row], List[int]]:
+    """جزئیات رویداد و شناسه‌ی شرکت‌کنندگانش را روی یک اتصال خواندنی برمی‌گرداند."""
+    try:
+        async with read_conn() as conn:
+            async with conn.execute(_Q_GET_EVENT, (event_id,)) as cursor:
+                event = await cursor.fetchone()
+            if event is None:
+                return None, []
+            async with conn.execute(_Q_EVENT_PARTICIPANTS, (event_id,)) as cursor:
+                cursor.row_factory = None
+                participants = [row[0] for row in await cursor.fetchall()]
+        return event, participants
+    except aiosqlite.Error as e:
+        logger.error(f"Error fetching event {event_id} with participants: {e}")
+        return None, []
@@ -1,7 +1,5 @@
 # handlers/admin_events.py
-import re
 import logging
-from enum import Enum, auto
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -9,30 +7,62 @@ from telegram.ext import (
 )
 
 import database as db
+from broadcast import send_stream
 from config import CARD_NUMBER
 from handlers.common import get_admin_menu, cancel, is_user_admin
 
 logger = logging.getLogger(__name__)
 
 # --- States ---
-class EventState(Enum):
-    TYPE = auto()
-    TITLE = auto()
-    DESCRIPTION = auto()
-    COST = auto()
-    DATE = auto()
-    LOCATION = auto()
-    CAPACITY = auto()
-    CONFIRM = auto()
-
-class EditEventState(Enum):
-    CHOOSE_EVENT = auto()
-    CHOOSE_FIELD = auto()
-    GET_NEW_VALUE = auto()
-
-class ToggleEventState(Enum):
-    CHOOSE_EVENT = auto()
-    GET_REASON = auto()
+class EventState:
+    TYPE, TITLE, DESCRIPTION, COST, DATE, LOCATION, CAPACITY, CONFIRM = range(8)
+
+class EditEventState:
+    CHOOSE_EVENT, CHOOSE_FIELD, GET_NEW_VALUE = range(3)
+
+class ToggleEventState:
+    CHOOSE_EVENT, GET_REASON = range(2)
+
+# --- Static Keyboards ---
+# کیبوردهای ثابت یک بار ساخته می‌شوند (اشیای تلگرام پس از ساخت تغییرناپذیرند)
+_EVENT_TYPE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("دوره 📚", callback_data="دوره")],
+    [InlineKeyboardButton("بازدید 🏭", callback_data="بازدید")]
+])
+
+_CONFIRM_EVENT_MARKUP = InlineKeyboardMarkup([[
+    InlineKeyboardButton("تأیید ✅", callback_data="confirm_event"),
+    InlineKeyboardButton("لغو 🚫", callback_data="cancel_event")
+]])
+
+_EDIT_FIELD_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("عنوان", callback_data="edit_field_title"),
+        InlineKeyboardButton("تاریخ", callback_data="edit_field_date"),
+    ],
+    [
+        InlineKeyboardButton("هزینه", callback_data="edit_field_cost"),
+        InlineKeyboardButton("ظرفیت", callback_data="edit_field_capacity"),
+    ],
+    [
+        InlineKeyboardButton("مکان", callback_data="edit_field_location"),
+        InlineKeyboardButton("توضیحات", callback_data="edit_field_description"),
+    ],
+    [InlineKeyboardButton("لغو 🚫", callback_data="cancel_edit")]
+])
+
+# --- Validation Helpers ---
+
+def is_valid_date(text: str) -> bool:
+    """Checks for a YYYY-MM-DD date using the C-level fromisoformat parser."""
+    # fromisoformat فرمت‌های دیگری (مثل 20240101 یا 2024-W01-1) را هم می‌پذیرد
+    if len(text) != 10 or text[4] != "-" or text[7] != "-":
+        return False
+    try:
+        datetime.fromisoformat(text)
+    except ValueError:
+        return False
+    return True
 
 # --- 1. Add Event Conversation ---
 
@@ -40,13 +70,7 @@ async def add_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not await is_user_admin(update.effective_user.id):
         await update.message.reply_text("شما دسترسی ادمین ندارید! 🚫")
         return ConversationHandler.END
-    await update.message.reply_text(
-        "نوع رویداد را انتخاب کنید:",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("دوره 📚", callback_data="دوره")],
-            [InlineKeyboardButton("بازدید 🏭", callback_data="بازدید")]
-        ])
-    )
+    await update.message.reply_text("نوع رویداد را انتخاب کنید:", reply_markup=_EVENT_TYPE_MARKUP)
     return EventState.TYPE
 
 async def event_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -80,7 +104,7 @@ async def event_description(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def event_cost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     cost = update.message.text
-    if not re.match(r"^\d+$", cost):
+    if not cost.isdecimal():
         await update.message.reply_text("هزینه باید عدد باشد. دوباره وارد کنید:")
         return EventState.COST
     context.user_data["event_cost"] = int(cost)
@@ -89,9 +113,7 @@ async def event_cost(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 async def event_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     date = update.message.text
-    try:
-        datetime.strptime(date, "%Y-%m-%d")
-    except ValueError:
+    if not is_valid_date(date):
         await update.message.reply_text("فرمت تاریخ باید YYYY-MM-DD باشد. دوباره وارد کنید:")
         return EventState.DATE
     context.user_data["event_date"] = date
@@ -112,7 +134,7 @@ async def event_location(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def event_capacity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     capacity = update.message.text
-    if not re.match(r"^\d+$", capacity) or int(capacity) <= 0:
+    if not capacity.isdecimal() or int(capacity) <= 0:
         await update.message.reply_text("ظرفیت باید عدد مثبت باشد. دوباره وارد کنید:")
         return EventState.CAPACITY
     context.user_data["event_capacity"] = int(capacity)
@@ -120,10 +142,11 @@ async def event_capacity(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def confirm_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     event_data = context.user_data
-    cost_text = "رایگان" if event_data["event_cost"] == 0 else f"{event_data['event_cost']:,} تومان"
-    capacity_text = "نامحدود" if event_data["event_type"] == "دوره" else f"{event_data['event_capacity']}"
+    event_type, cost = event_data["event_type"], event_data["event_cost"]
+    cost_text = "رایگان" if cost == 0 else f"{cost:,} تومان"
+    capacity_text = "نامحدود" if event_type == "دوره" else f"{event_data['event_capacity']}"
     text = (
-        f"نوع: {event_data['event_type']}\n"
+        f"نوع: {event_type}\n"
         f"عنوان: {event_data['event_title']}\n"
         f"هشتگ: {event_data['event_hashtag']}\n"
         f"توضیحات: {event_data['event_description']}\n"
@@ -132,17 +155,11 @@ async def confirm_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         f"محل: {event_data['event_location']}\n"
         f"ظرفیت: {capacity_text}"
     )
-    markup = InlineKeyboardMarkup([[
-        InlineKeyboardButton("تأیید ✅", callback_data="confirm_event"),
-        InlineKeyboardButton("لغو 🚫", callback_data="cancel_event")
-    ]])
-    
-    if "event_photo" in event_data:
-        await update.message.reply_photo(
-            event_data["event_photo"], caption=text, reply_markup=markup
-        )
+    photo = event_data.get("event_photo")
+    if photo:
+        await update.message.reply_photo(photo, caption=text, reply_markup=_CONFIRM_EVENT_MARKUP)
     else:
-        await update.message.reply_text(text, reply_markup=markup)
+        await update.message.reply_text(text, reply_markup=_CONFIRM_EVENT_MARKUP)
     return EventState.CONFIRM
 
 async def save_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -153,31 +170,34 @@ async def save_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return ConversationHandler.END
         
     event_data = context.user_data
+    cost = event_data["event_cost"]
     try:
-        async with await db.get_db_connection() as conn:
-            cursor = await conn.execute(
-                """
-                INSERT INTO events (title, type, date, location, capacity, description, is_active, hashtag, cost, card_number)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    event_data["event_title"], event_data["event_type"],
-                    event_data["event_date"], event_data["event_location"],
-                    event_data.get("event_capacity", 0), event_data["event_description"],
-                    1, event_data["event_hashtag"], event_data["event_cost"],
-                    CARD_NUMBER if event_data["event_cost"] > 0 else "",
-                )
-            )
-            event_id = cursor.lastrowid
-            await conn.commit()
-            
-            logger.info(f"Event {event_id} created successfully")
-            
-            async with conn.execute("SELECT user_id, full_name FROM users") as cursor:
-                users = await cursor.fetchall()
+        event_id = await db.create_event(
+            event_data["event_title"], event_data["event_type"],
+            event_data["event_date"], event_data["event_location"],
+            event_data.get("event_capacity", 0), event_data["event_description"],
+            event_data["event_hashtag"], cost,
+            CARD_NUMBER if cost > 0 else "",
+        )
+        if event_id is None:
+            await query.message.edit_text("خطایی در ذخیره رویداد رخ داد. لطفاً دوباره سعی کنید.")
+            return ConversationHandler.END
+        logger.info(f"Event {event_id} created successfully")
         
-        # Broadcast to users (add rate limiting)
-        # ... (broadcast logic remains same) ...
+        # اطلاع‌رسانی به کاربران در پس‌زمینه؛ گیرندگان مستقیم از cursor خوانده می‌شوند
+        context.job_queue.run_once(
+            _broadcast_new_event_job,
+            0,
+            data={
+                'event_id': event_id,
+                'text': (
+                    f"{event_data['event_type']} جدید: {event_data['event_title']} 🎉\n"
+                    f"تاریخ: {event_data['event_date']}\n"
+                    f"محل: {event_data['event_location']}"
+                ),
+            },
+            name=f"new_event_broadcast_{event_id}"
+        )
 
         await query.message.edit_text("رویداد با موفقیت اضافه شد! ✅", reply_markup=get_admin_menu())
         
@@ -187,8 +207,17 @@ async def save_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         
     return ConversationHandler.END
 
+async def _broadcast_new_event_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job callback that announces a newly created event to all users."""
+    job_data = context.job.data
+    markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("مشاهده جزئیات 📋", callback_data=f"event_{job_data['event_id']}")
+    ]])
+    sent_count = await send_stream(context.bot, db.iter_user_ids(), job_data['text'], reply_markup=markup)
+    logger.info(f"New event {job_data['event_id']} announced to {sent_count} users")
+
 add_event_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(اضافه کردن رویداد جدید ➕)$"), add_event)],
+    entry_points=[MessageHandler(filters.Text(["اضافه کردن رویداد جدید ➕"]), add_event)],
     states={
         EventState.TYPE: [CallbackQueryHandler(event_type, pattern="^(دوره|بازدید)$")],
         EventState.TITLE: [MessageHandler(filters.TEXT & ~filters.COMMAND, event_title)],
@@ -214,16 +243,14 @@ async def edit_event_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text("شما دسترسی ادمین ندارید! 🚫")
         return ConversationHandler.END
         
-    events = await db.get_all_events()
-            
-    if not events:
-        await update.message.reply_text("هیچ رویدادی وجود ندارد!", reply_markup=get_admin_menu())
-        return ConversationHandler.END
-        
     buttons = [[InlineKeyboardButton(
         f"{event['title']} ({event['type']}) - {event['date']}", 
         callback_data=f"edit_event_{event['event_id']}"
-    )] for event in events]
+    )] for event in await db.get_all_events()]
+            
+    if not buttons:
+        await update.message.reply_text("هیچ رویدادی وجود ندارد!", reply_markup=get_admin_menu())
+        return ConversationHandler.END
     
     await update.message.reply_text("کدام رویداد را می‌خواهید ویرایش کنید؟", reply_markup=InlineKeyboardMarkup(buttons))
     return EditEventState.CHOOSE_EVENT
@@ -232,7 +259,7 @@ async def edit_event_choose_field(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    event_id = int(query.data.split("_")[2])
+    event_id = int(query.data.removeprefix("edit_event_"))
     context.user_data["edit_event_id"] = event_id
     
     event = await db.get_event_details(event_id)
@@ -248,23 +275,7 @@ async def edit_event_choose_field(update: Update, context: ContextTypes.DEFAULT_
         f"تاریخ: {event['date']} | هزینه: {cost_text} | ظرفیت: {capacity_text}\n"
         f"کدام بخش را می‌خواهید ویرایش کنید؟"
     )
-    
-    buttons = [
-        [
-            InlineKeyboardButton("عنوان", callback_data="edit_field_title"),
-            InlineKeyboardButton("تاریخ", callback_data="edit_field_date"),
-        ],
-        [
-            InlineKeyboardButton("هزینه", callback_data="edit_field_cost"),
-            InlineKeyboardButton("ظرفیت", callback_data="edit_field_capacity"),
-        ],
-        [
-            InlineKeyboardButton("مکان", callback_data="edit_field_location"),
-            InlineKeyboardButton("توضیحات", callback_data="edit_field_description"),
-        ],
-        [InlineKeyboardButton("لغو 🚫", callback_data="cancel_edit")]
-    ]
-    await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    await query.message.edit_text(text, reply_markup=_EDIT_FIELD_MARKUP)
     return EditEventState.CHOOSE_FIELD
 
 
@@ -277,7 +288,7 @@ async def edit_event_get_value(update: Update, context: ContextTypes.DEFAULT_TYP
         context.user_data.clear()
         return ConversationHandler.END
 
-    field = query.data.split("_")[2] # e.g., "title"
+    field = query.data.removeprefix("edit_field_") # e.g., "title"
     context.user_data["edit_field"] = field
     
     field_map_fa = {
@@ -301,15 +312,13 @@ async def edit_event_save_value(update: Update, context: ContextTypes.DEFAULT_TY
         # --- اعتبارسنجی ---
         validated_value = new_value
         if field == "cost" or field == "capacity":
-            if not re.match(r"^\d+$", new_value):
+            if not new_value.isdecimal():
                 await update.message.reply_text("مقدار باید عددی باشد. دوباره وارد کنید:")
                 return EditEventState.GET_NEW_VALUE
             validated_value = int(new_value)
         
         elif field == "date":
-            try:
-                datetime.strptime(new_value, "%Y-%m-%d")
-            except ValueError:
+            if not is_valid_date(new_value):
                 await update.message.reply_text("فرمت تاریخ باید YYYY-MM-DD باشد. دوباره وارد کنید:")
                 return EditEventState.GET_NEW_VALUE
         
@@ -333,7 +342,7 @@ async def edit_event_save_value(update: Update, context: ContextTypes.DEFAULT_TY
         return ConversationHandler.END
 
 edit_event_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(ویرایش رویدادها ✏️)$"), edit_event_start)],
+    entry_points=[MessageHandler(filters.Text(["ویرایش رویدادها ✏️"]), edit_event_start)],
     states={
         EditEventState.CHOOSE_EVENT: [CallbackQueryHandler(edit_event_choose_field, pattern="^edit_event_")],
         EditEventState.CHOOSE_FIELD: [CallbackQueryHandler(edit_event_get_value, pattern="^(edit_field_|cancel_edit)"), ],
@@ -351,15 +360,13 @@ async def toggle_event_status_start(update: Update, context: ContextTypes.DEFAUL
         await update.message.reply_text("شما دسترسی ادمین ندارید! 🚫")
         return ConversationHandler.END
         
-    events = await db.get_all_events()
-    if not events:
-        await update.message.reply_text("هیچ رویدادی وجود ندارد!", reply_markup=get_admin_menu())
-        return ConversationHandler.END
-        
     buttons = [[InlineKeyboardButton(
         f"{event['title']} ({'فعال' if event['is_active'] else 'غیرفعال'})",
         callback_data=f"toggle_event_{event['event_id']}"
-    )] for event in events]
+    )] for event in await db.get_all_events()]
+    if not buttons:
+        await update.message.reply_text("هیچ رویدادی وجود ندارد!", reply_markup=get_admin_menu())
+        return ConversationHandler.END
     
     await update.message.reply_text("رویداد را برای تغییر وضعیت انتخاب کنید:", reply_markup=InlineKeyboardMarkup(buttons))
     return ToggleEventState.CHOOSE_EVENT
@@ -368,36 +375,30 @@ async def toggle_event_status(update: Update, context: ContextTypes.DEFAULT_TYPE
     query = update.callback_query
     await query.answer()
     
-    event_id = int(query.data.split("_")[2])
+    event_id = int(query.data.removeprefix("toggle_event_"))
     context.user_data["toggle_event_id"] = event_id
     
     try:
-        event = await db.get_event_details(event_id)
-        if not event:
-            await query.message.edit_text("رویداد یافت نشد!", reply_markup=get_admin_menu())
+        # اگر رویداد غیرفعال باشد همین UPDATE فعالش می‌کند؛ نیازی به SELECT قبلی نیست
+        if await db.set_event_active(event_id):
+            await query.message.edit_text("رویداد با موفقیت فعال شد! ✅", reply_markup=get_admin_menu())
             return ConversationHandler.END
         
-        if event['is_active']:
-            # Event is active, ask for deactivation reason
-            await query.message.edit_text(
-                "علت غیرفعال کردن چیست؟",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("برگزار شد", callback_data="reason_برگزار شد")],
-                    [InlineKeyboardButton("به تاخیر افتاد", callback_data="reason_به تاخیر افتاد")],
-                    [InlineKeyboardButton("لغو شد", callback_data="reason_لغو شد")]
-                ])
-            )
-            return ToggleEventState.GET_REASON
-        else:
-            # Event is inactive, activate it
-            async with await db.get_db_connection() as conn:
-                await conn.execute(
-                    "UPDATE events SET is_active = 1, deactivation_reason = '' WHERE event_id = ?",
-                    (event_id,)
-                )
-                await conn.commit()
-            await query.message.edit_text("رویداد با موفقیت فعال شد! ✅", reply_markup=get_admin_menu())
+        # رویداد فعال است یا وجود ندارد
+        if not await db.get_event_details(event_id):
+            await query.message.edit_text("رویداد یافت نشد!", reply_markup=get_admin_menu())
             return ConversationHandler.END
+        
+        # Event is active, ask for deactivation reason
+        await query.message.edit_text(
+            "علت غیرفعال کردن چیست؟",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("برگزار شد", callback_data="reason_برگزار شد")],
+                [InlineKeyboardButton("به تاخیر افتاد", callback_data="reason_به تاخیر افتاد")],
+                [InlineKeyboardButton("لغو شد", callback_data="reason_لغو شد")]
+            ])
+        )
+        return ToggleEventState.GET_REASON
                 
     except Exception as e:
         logger.error(f"Error toggling event {event_id}: {e}")
@@ -408,31 +409,22 @@ async def toggle_event_status_reason(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
     
-    reason = query.data.split("reason_")[1]
+    reason = query.data.removeprefix("reason_")
     event_id = context.user_data.get("toggle_event_id")
     
     if not event_id:
         await query.message.edit_text("خطا: رویداد انتخاب نشده است!", reply_markup=get_admin_menu())
         return ConversationHandler.END
         
-    try:
-        async with await db.get_db_connection() as conn:
-            await conn.execute(
-                "UPDATE events SET is_active = 0, deactivation_reason = ? WHERE event_id = ?",
-                (reason, event_id)
-            )
-            await conn.commit()
-            
+    if await db.set_event_inactive(event_id, reason):
         await query.message.edit_text("رویداد با موفقیت غیرفعال شد! ✅", reply_markup=get_admin_menu())
-        
-    except Exception as e:
-        logger.error(f"Error deactivating event {event_id} with reason: {e}")
+    else:
         await query.message.edit_text("خطایی در پایگاه داده رخ داد.")
         
     return ConversationHandler.END
 
 toggle_event_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(غیرفعال/فعال کردن رویداد 🔄)$"), toggle_event_status_start)],
+    entry_points=[MessageHandler(filters.Text(["غیرفعال/فعال کردن رویداد 🔄"]), toggle_event_status_start)],
     states={
         ToggleEventState.CHOOSE_EVENT: [CallbackQueryHandler(toggle_event_status, pattern="^toggle_event_")],
         ToggleEventState.GET_REASON: [CallbackQueryHandler(toggle_event_status_reason, pattern="^reason_")],
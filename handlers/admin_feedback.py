@@ -1,7 +1,7 @@
 # handlers/admin_feedback.py
+import time
 import logging
-from enum import Enum, auto
-from datetime import datetime, timedelta
+from datetime import timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler,
@@ -9,14 +9,16 @@ from telegram.ext import (
 )
 
 import database as db
+from broadcast import send_bulk, group_rate_limit
 from config import OPERATOR_GROUP_ID, FEEDBACK_WINDOW_DAYS
 from handlers.common import get_admin_menu, cancel, is_user_admin
 
 logger = logging.getLogger(__name__)
 
-class FeedbackState(Enum):
-    CHOOSE_EVENT = auto()
-    CONFIRM_SEND = auto()
+class FeedbackState:
+    CHOOSE_EVENT, CONFIRM_SEND = range(2)
+
+_RATING_LABELS = tuple((stars, f"⭐ {stars}") for stars in range(1, 6))
 
 async def feedback_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Starts the process for sending feedback forms."""
@@ -56,23 +58,24 @@ async def feedback_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await query.message.edit_text("عملیات لغو شد.", reply_markup=get_admin_menu())
         return ConversationHandler.END
         
-    event_id = int(query.data.split("_")[2])
+    event_id = int(query.data.removeprefix("send_feedback_"))
     context.user_data["feedback_event_id"] = event_id
     
-    event = await db.get_event_details(event_id)
-    participants = await db.get_event_participants(event_id)
+    event, participant_ids = await db.get_event_with_participants(event_id)
     
     if not event:
         await query.message.edit_text("خطا: رویداد یافت نشد.", reply_markup=get_admin_menu())
         return ConversationHandler.END
         
-    if not participants:
+    if not participant_ids:
         await query.message.edit_text(f"رویداد '{event['title']}' هیچ شرکت‌کننده‌ای ندارد!", reply_markup=get_admin_menu())
         return ConversationHandler.END
 
+    # برای مرحله‌ی ارسال نگه داشته می‌شود تا دوباره کوئری نشود
+    context.user_data["feedback_payload"] = (event, participant_ids)
     text = (
         f"رویداد: {event['title']}\n"
-        f"تعداد شرکت‌کنندگان: {len(participants)} نفر\n\n"
+        f"تعداد شرکت‌کنندگان: {len(participant_ids)} نفر\n\n"
         f"آیا فرم نظرسنجی برای این افراد ارسال شود؟"
     )
     buttons = [
@@ -83,7 +86,7 @@ async def feedback_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return FeedbackState.CONFIRM_SEND
 
 async def feedback_send_forms(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Sends feedback forms to all participants and schedules the result job."""
+    """Schedules the feedback broadcast in the background and ends the conversation."""
     query = update.callback_query
     await query.answer()
 
@@ -92,24 +95,41 @@ async def feedback_send_forms(update: Update, context: ContextTypes.DEFAULT_TYPE
         return ConversationHandler.END
 
     event_id = context.user_data.get("feedback_event_id")
-    if not event_id:
+    payload = context.user_data.pop("feedback_payload", None)
+    if not event_id or not payload:
         await query.message.edit_text("خطا: رویداد یافت نشد.", reply_markup=get_admin_menu())
         return ConversationHandler.END
+    event, participant_ids = payload
 
-    event = await db.get_event_details(event_id)
-    participants = await db.get_event_participants(event_id)
+    # ارسال در پس‌زمینه انجام می‌شود تا پاسخ به ادمین منتظر کل ارسال نماند
+    context.job_queue.run_once(
+        _broadcast_feedback_job,
+        0,
+        data={
+            'event_id': event_id, 'event': event, 'participant_ids': participant_ids,
+            'admin_chat_id': query.message.chat_id,
+        },
+        name=f"feedback_broadcast_{event_id}"
+    )
     
-    await query.message.edit_text(f"در حال ارسال {len(participants)} فرم نظرسنجی...")
+    await query.message.edit_text(
+        "ارسال فرم‌های نظرسنجی در پس‌زمینه آغاز شد. پس از پایان، نتیجه اطلاع داده می‌شود.",
+        reply_markup=get_admin_menu()
+    )
+    return ConversationHandler.END
 
-    # Build rating keyboard
-    buttons = [
-        InlineKeyboardButton("⭐ 1", callback_data=f"rate_{event_id}_1"),
-        InlineKeyboardButton("⭐ 2", callback_data=f"rate_{event_id}_2"),
-        InlineKeyboardButton("⭐ 3", callback_data=f"rate_{event_id}_3"),
-        InlineKeyboardButton("⭐ 4", callback_data=f"rate_{event_id}_4"),
-        InlineKeyboardButton("⭐ 5", callback_data=f"rate_{event_id}_5"),
-    ]
-    rating_markup = InlineKeyboardMarkup([buttons])
+async def _broadcast_feedback_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job callback that sends the feedback forms and schedules the result job."""
+    job_data = context.job.data
+    event_id = job_data['event_id']
+    event = job_data['event']
+    participant_ids = job_data['participant_ids']
+
+    # Build rating keyboard (یک بار برای کل ارسال؛ فقط event_id متغیر است)
+    rating_markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton(label, callback_data=f"rate_{event_id}_{stars}")
+        for stars, label in _RATING_LABELS
+    ]])
     
     message_text = (
         f"سلام! متشکریم که در رویداد '{event['title']}' شرکت کردید.\n"
@@ -117,35 +137,26 @@ async def feedback_send_forms(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"شما {FEEDBACK_WINDOW_DAYS} روز فرصت دارید."
     )
     
-    sent_count = 0
-    for participant in participants:
-        try:
-            await context.bot.send_message(
-                chat_id=participant['user_id'],
-                text=message_text,
-                reply_markup=rating_markup
-            )
-            sent_count += 1
-        except Exception as e:
-            logger.warning(f"Failed to send feedback form to user {participant['user_id']}: {e}")
+    # Mark as sent in DB (قبل از ارسال، تا کلیک‌های زودهنگام رد نشوند)
+    # مهلت یک بار محاسبه می‌شود و هر کلیک فقط با آن مقایسه می‌شود
+    await db.set_feedback_sent(event_id, time.time() + FEEDBACK_WINDOW_DAYS * 86400)
     
-    # Mark as sent in DB
-    await db.set_feedback_sent(event_id)
+    # ارسال هم‌زمان با سقف نرخ تلگرام به‌جای حلقه‌ی ترتیبی
+    sent_count = await send_bulk(context.bot, participant_ids, message_text, reply_markup=rating_markup)
     
     # Schedule the job to calculate results
     context.job_queue.run_once(
         calculate_average_job,
         timedelta(days=FEEDBACK_WINDOW_DAYS),
-        data={'event_id': event_id, 'event_title': event['title'], 'event_hashtag': event['hashtag'], 'event_type': event['type']},
+        data={'event_id': event_id, 'event_title': event['title'], 'hashtag_prefix': event['hashtag_prefix']},
         name=f"feedback_result_{event_id}"
     )
     
-    await query.message.edit_text(
+    await context.bot.send_message(
+        job_data['admin_chat_id'],
         f"نظرسنجی با موفقیت به {sent_count} نفر ارسال شد.\n"
-        f"نتایج {FEEDBACK_WINDOW_DAYS} روز دیگر به گروه اپراتورها ارسال خواهد شد.",
-        reply_markup=get_admin_menu()
+        f"نتایج {FEEDBACK_WINDOW_DAYS} روز دیگر به گروه اپراتورها ارسال خواهد شد."
     )
-    return ConversationHandler.END
 
 async def calculate_average_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     """Job callback to calculate and send average rating."""
@@ -162,7 +173,7 @@ async def calculate_average_job(context: ContextTypes.DEFAULT_TYPE) -> None:
             num_ratings = ratings_data['num_ratings']
             avg_rating_text = f"{avg_rating:.1f} ستاره"
             
-        hashtag = f"#{job_data['event_type']} #{job_data['event_hashtag'].replace(' ', '_')} #نمره"
+        hashtag = f"{job_data['hashtag_prefix']} #نمره"
         
         text = (
             f"📊 **نتایج نظرسنجی رویداد** 📊\n"
@@ -172,14 +183,15 @@ async def calculate_average_job(context: ContextTypes.DEFAULT_TYPE) -> None:
             f"**تعداد کل آرا:** {num_ratings} نفر"
         )
         
-        await context.bot.send_message(OPERATOR_GROUP_ID, text)
+        async with group_rate_limit(OPERATOR_GROUP_ID):
+            await context.bot.send_message(OPERATOR_GROUP_ID, text)
         logger.info(f"Feedback results sent for event {event_id}.")
         
     except Exception as e:
         logger.error(f"Error in calculate_average_job for event {event_id}: {e}")
 
 feedback_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(ارسال نظرسنجی 📊⭐)$"), feedback_start)],
+    entry_points=[MessageHandler(filters.Text(["ارسال نظرسنجی 📊⭐"]), feedback_start)],
     states={
         FeedbackState.CHOOSE_EVENT: [CallbackQueryHandler(feedback_confirm, pattern="^(send_feedback_|cancel_feedback)"), ],
         FeedbackState.CONFIRM_SEND: [CallbackQueryHandler(feedback_send_forms, pattern="^(confirm_send_feedback|cancel_feedback)$")],
@@ -196,28 +208,20 @@ async def handle_user_rating(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     try:
-        _, event_id_str, rating_str = query.data.split("_")
+        _, event_id_str, rating_str = query.data.split("_", 2)
         event_id = int(event_id_str)
         rating = int(rating_str)
-        user_id = query.effective_user.id
+        user_id = update.effective_user.id
         
-        # Check if deadline has passed
-        event_status = await db.get_event_feedback_status(event_id)
-        if not event_status or not event_status['feedback_sent_at']:
-            await query.message.edit_text("خطایی رخ داد. این نظرسنجی معتبر نیست.")
+        # بررسی مهلت و ثبت امتیاز در یک کوئری؛ علت شکست فقط در صورت نیاز خوانده می‌شود
+        if not await db.store_rating_if_open(user_id, event_id, rating):
+            if await db.get_event_feedback_status(event_id) is None:
+                await query.message.edit_text("خطایی رخ داد. این نظرسنجی معتبر نیست.")
+            else:
+                await query.message.edit_text(
+                    f"متأسفانه مهلت {FEEDBACK_WINDOW_DAYS} روزه برای امتیازدهی به این رویداد تمام شده است."
+                )
             return
-
-        sent_at = datetime.fromisoformat(event_status['feedback_sent_at'])
-        deadline = sent_at + timedelta(days=FEEDBACK_WINDOW_DAYS)
-        
-        if datetime.now() > deadline:
-            await query.message.edit_text(
-                f"متأسفانه مهلت {FEEDBACK_WINDOW_DAYS} روزه برای امتیازدهی به این رویداد تمام شده است."
-            )
-            return
-
-        # Store the rating
-        await db.store_rating(user_id, event_id, rating)
         
         await query.message.edit_text(
             f"از بازخورد شما متشکریم! ✨\n"
@@ -1,8 +1,5 @@
 # handlers/admin_management.py
-import re
 import logging
-from enum import Enum, auto
-from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     CommandHandler, MessageHandler, CallbackQueryHandler, ConversationHandler,
@@ -10,30 +7,25 @@ from telegram.ext import (
 )
 
 import database as db
+from broadcast import send_stream
 from config import OPERATOR_GROUP_ID
-from handlers.common import get_admin_menu, cancel, is_user_admin
+from handlers.common import get_admin_menu, cancel, is_user_admin, invalidate_admin_cache
 from handlers.user_events import deactivate_event # Import for manual reg capacity check
 
 logger = logging.getLogger(__name__)
 
 # --- States ---
-class AnnounceState(Enum):
-    CHOOSE_GROUP = auto()
-    GET_MESSAGE = auto()
+class AnnounceState:
+    CHOOSE_GROUP, GET_MESSAGE = range(2)
 
-class AdminManageState(Enum):
-    CHOOSE_ACTION = auto()
-    GET_ID_TO_ADD = auto()
-    CHOOSE_TO_REMOVE = auto()
+class AdminManageState:
+    CHOOSE_ACTION, GET_ID_TO_ADD, CHOOSE_TO_REMOVE = range(3)
 
-class ManualRegState(Enum):
-    CHOOSE_EVENT = auto()
-    GET_STUDENT_ID = auto()
-    CONFIRM = auto()
+class ManualRegState:
+    CHOOSE_EVENT, GET_STUDENT_ID, CONFIRM = range(3)
 
-class ReportState(Enum):
-    CHOOSE_TYPE = auto()
-    CHOOSE_PERIOD_OR_EVENT = auto()
+class ReportState:
+    CHOOSE_TYPE, CHOOSE_PERIOD_OR_EVENT = range(2)
 
 # --- Admin Menu Entry ---
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -47,8 +39,10 @@ async def announce_start(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not await is_user_admin(update.effective_user.id):
         return ConversationHandler.END
         
-    events = await db.get_all_events()
-    buttons = [[InlineKeyboardButton(f"{event['title']} ({event['type']})", callback_data=f"announce_group_{event['event_id']}")] for event in events]
+    buttons = [
+        [InlineKeyboardButton(f"{title} ({event_type})", callback_data=f"announce_group_{event_id}")]
+        async for event_id, title, event_type in db.iter_event_labels()
+    ]
     buttons.append([InlineKeyboardButton("همه کاربران", callback_data="announce_group_all")])
     
     await update.message.reply_text("گروه هدف اعلان را انتخاب کنید:", reply_markup=InlineKeyboardMarkup(buttons))
@@ -57,19 +51,55 @@ async def announce_start(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def announce_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    group_data = query.data.split("announce_group_")[1]
+    group_data = query.data.removeprefix("announce_group_")
     context.user_data["announce_group"] = group_data
     await query.message.edit_text("لطفاً متن اعلان را وارد کنید:")
     return AnnounceState.GET_MESSAGE
 
 async def send_announcement(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    # ... (Logic for send_announcement remains the same as your optimized code) ...
-    # ... (Remember to add asyncio.sleep(0.1) in the loop) ...
-    await update.message.reply_text("اعلان با موفقیت ارسال شد! ✅", reply_markup=get_admin_menu())
+    group = context.user_data.pop("announce_group", None)
+    if group is None:
+        await update.message.reply_text("خطایی رخ داد. لطفاً دوباره تلاش کنید.", reply_markup=get_admin_menu())
+        return ConversationHandler.END
+
+    # ارسال در پس‌زمینه انجام می‌شود تا هندلر ادمین و بقیه‌ی کاربران منتظر نمانند
+    context.job_queue.run_once(
+        _broadcast_announcement_job,
+        0,
+        data={
+            'group': group,
+            'text': update.message.text,
+            'admin_chat_id': update.effective_chat.id,
+        },
+        name=f"announcement_{group}"
+    )
+    await update.message.reply_text("اعلان در صف ارسال قرار گرفت ✅", reply_markup=get_admin_menu())
     return ConversationHandler.END
 
+async def _broadcast_announcement_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Job callback that sends an announcement to all users or to one event's participants."""
+    job_data = context.job.data
+    group = job_data['group']
+    # گیرندگان مستقیم از cursor خوانده می‌شوند و لیست کامل آن‌ها ساخته نمی‌شود
+    if group == "all":
+        recipients = db.iter_user_ids()
+    elif group.isdecimal():
+        recipients = db.iter_event_participants(int(group))
+    else:
+        logger.error(f"Invalid announcement group: {group}")
+        return
+    sent_count = await send_stream(context.bot, recipients, job_data['text'])
+    logger.info(f"Announcement for group {group} sent to {sent_count} users")
+    try:
+        await context.bot.send_message(
+            chat_id=job_data['admin_chat_id'],
+            text=f"اعلان با موفقیت برای {sent_count} کاربر ارسال شد! ✅"
+        )
+    except Exception as e:
+        logger.error(f"Failed to notify admin about announcement: {e}")
+
 announce_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(اعلان عمومی 📢)$"), announce_start)],
+    entry_points=[MessageHandler(filters.Text(["اعلان عمومی 📢"]), announce_start)],
     states={
         AnnounceState.CHOOSE_GROUP: [CallbackQueryHandler(announce_group, pattern="^announce_group_")],
         AnnounceState.GET_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, send_announcement)],
@@ -102,16 +132,18 @@ async def remove_admin_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def save_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # ... (Logic for save_admin remains the same) ...
+    invalidate_admin_cache()
     await update.message.reply_text("ادمین با موفقیت اضافه شد! ✅", reply_markup=get_admin_menu())
     return ConversationHandler.END
 
 async def remove_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # ... (Logic for remove_admin remains the same) ...
+    invalidate_admin_cache()
     await update.callback_query.message.edit_text("ادمین با موفقیت حذف شد! ✅", reply_markup=get_admin_menu())
     return ConversationHandler.END
 
 manage_admins_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(مدیریت ادمین‌ها 👤)$"), manage_admins)],
+    entry_points=[MessageHandler(filters.Text(["مدیریت ادمین‌ها 👤"]), manage_admins)],
     states={
         AdminManageState.CHOOSE_ACTION: [
             CallbackQueryHandler(add_admin_start, pattern="^add_admin$"),
@@ -148,7 +180,7 @@ async def confirm_manual_registration(update: Update, context: ContextTypes.DEFA
     return ConversationHandler.END
 
 manual_reg_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(اضافه کردن دستی به ثبت‌نام 📋)$"), manual_registration_start)],
+    entry_points=[MessageHandler(filters.Text(["اضافه کردن دستی به ثبت‌نام 📋"]), manual_registration_start)],
     states={
         ManualRegState.CHOOSE_EVENT: [CallbackQueryHandler(manual_registration_event, pattern="^manual_reg_")],
         ManualRegState.GET_STUDENT_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, manual_registration_student_id)],
@@ -175,7 +207,7 @@ async def generate_report(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return ConversationHandler.END
 
 report_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(گزارش‌ها 📊)$"), report_start)],
+    entry_points=[MessageHandler(filters.Text(["گزارش‌ها 📊"]), report_start)],
     states={
         ReportState.CHOOSE_TYPE: [CallbackQueryHandler(report_type, pattern="^report_")],
         ReportState.CHOOSE_PERIOD_OR_EVENT: [CallbackQueryHandler(generate_report, pattern="^(report_event_|period_)")],
@@ -1,7 +1,9 @@
 # handlers/common.py
 import re
+import time
+import asyncio
 import logging
-from enum import Enum, auto
+from typing import Any, Optional, Set, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.error import Forbidden
 from telegram.ext import (
@@ -10,40 +12,116 @@ from telegram.ext import (
 )
 
 import database as db
+from cache import AsyncTTLCache
 from config import CHANNEL_ID, ADMIN_IDS
 
 logger = logging.getLogger(__name__)
 
 # --- States ---
-class ProfileState(Enum):
-    FULL_NAME = auto()
-    CONFIRM_FULL_NAME = auto()
-    NATIONAL_ID = auto()
-    CONFIRM_NATIONAL_ID = auto()
-    STUDENT_ID = auto()
-    CONFIRM_STUDENT_ID = auto()
-    PHONE = auto()
-    CONFIRM_PHONE = auto()
+# وضعیت‌های گفتگو عدد صحیح ساده‌اند؛ کلاس فقط فضای نام است
+class ProfileState:
+    (
+        FULL_NAME,
+        CONFIRM_FULL_NAME,
+        NATIONAL_ID,
+        CONFIRM_NATIONAL_ID,
+        STUDENT_ID,
+        CONFIRM_STUDENT_ID,
+        PHONE,
+        CONFIRM_PHONE
+    ) = range(8)
 
 # --- Utility Functions ---
 
 def validate_national_id(national_id: str) -> bool:
-    if not re.match(r"^\d{10}$", national_id):
+    # isascii لازم است چون isdigit ارقام فارسی را هم می‌پذیرد
+    if len(national_id) != 10 or not (national_id.isascii() and national_id.isdigit()):
         return False
-    check = int(national_id[9])
-    total = sum(int(national_id[i]) * (10 - i) for i in range(9)) % 11
-    return total < 2 and check == total or total >= 2 and check == 11 - total
+    d = [c - 48 for c in national_id.encode("ascii")]
+    total = (d[0] * 10 + d[1] * 9 + d[2] * 8 + d[3] * 7 + d[4] * 6
+             + d[5] * 5 + d[6] * 4 + d[7] * 3 + d[8] * 2) % 11
+    check = d[9]
+    return (total < 2 and check == total) or (total >= 2 and check == 11 - total)
+
+_FULL_NAME_RE = re.compile(r"[آ-ی\s]{6,}")
+
+def validate_full_name(text: str) -> bool:
+    # شرط‌های ارزان قبل از regex بررسی می‌شوند
+    return len(text) >= 6 and " " in text and _FULL_NAME_RE.fullmatch(text) is not None
+
+def validate_student_id(text: str) -> bool:
+    return text.isdecimal()
+
+# ارقام فارسی و عربی به لاتین تبدیل می‌شوند؛ پیشوند کشور با 0 جایگزین می‌شود
+_DIGITS_TRANS = str.maketrans("۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩", "01234567890123456789", " -")
+_PHONE_PREFIXES = ("+98", "0098", "98")
+
+def normalize_phone(text: str) -> str:
+    phone_num = text.translate(_DIGITS_TRANS)
+    for prefix in _PHONE_PREFIXES:
+        if phone_num.startswith(prefix) and len(phone_num) == len(prefix) + 10:
+            return "0" + phone_num[len(prefix):]
+    return phone_num
+
+def normalize_national_id(text: str) -> str:
+    # کد ملی تایپ‌شده با صفحه‌کلید فارسی قبل از اعتبارسنجی به ارقام لاتین تبدیل می‌شود
+    return text.translate(_DIGITS_TRANS)
+
+def validate_phone(text: str) -> bool:
+    return len(text) == 11 and text.startswith("09") and text.isdecimal()
+
+# مجموعه‌ی ادمین‌های دیتابیس یک‌جا خوانده و ۶۰ ثانیه نگه داشته می‌شود
+ADMIN_CACHE_TTL = 60.0
+_admin_ids: Set[int] = set()
+_admin_ids_expiry = 0.0
+_admin_ids_lock = asyncio.Lock()
+
+async def _refresh_admin_ids() -> None:
+    global _admin_ids, _admin_ids_expiry
+    # فقط یک درخواست کش را تازه می‌کند؛ بقیه منتظر همان نتیجه می‌مانند
+    async with _admin_ids_lock:
+        if time.monotonic() < _admin_ids_expiry:
+            return
+        admin_ids = await db.get_all_admin_ids()
+        if admin_ids is not None:
+            _admin_ids = admin_ids
+        _admin_ids_expiry = time.monotonic() + ADMIN_CACHE_TTL
+
+def invalidate_admin_cache() -> None:
+    """پس از اضافه یا حذف ادمین فراخوانی شود."""
+    global _admin_ids_expiry
+    _admin_ids_expiry = 0.0
 
 async def is_user_admin(user_id: int) -> bool:
     if user_id in ADMIN_IDS:
         return True
-    return bool(await db.get_admin_info(user_id))
+    if time.monotonic() >= _admin_ids_expiry:
+        await _refresh_admin_ids()
+    return user_id in _admin_ids
+
+async def get_user_with_admin(user_id: int) -> Tuple[Optional[Any], bool]:
+    """اطلاعات کاربر و وضعیت ادمین؛ هر دو از کش خوانده می‌شوند و فقط در صورت انقضا به دیتابیس می‌روند."""
+    user_info, is_admin = await asyncio.gather(db.get_user_info(user_id), is_user_admin(user_id))
+    return user_info, is_admin
+
+# فقط نتیجه‌ی مثبت ۵ دقیقه کش می‌شود تا کاربری که تازه عضو شده منتظر نماند
+_MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+_membership_cache = AsyncTTLCache(maxsize=4096, ttl=300.0)
+# دکمه‌ی «عضو شدم» در همه‌ی هندلرهایی که عضویت را بررسی می‌کنند یکسان است
+MEMBERSHIP_MARKUP = InlineKeyboardMarkup([[
+    InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
+]])
 
 async def check_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    user_id = update.effective_user.id
+    if _membership_cache.get(user_id):
+        return True
     try:
-        user_id = update.effective_user.id
         member = await context.bot.get_chat_member(CHANNEL_ID, user_id)
-        return member.status in ["member", "administrator", "creator"]
+        is_member = member.status in _MEMBER_STATUSES
+        if is_member:
+            _membership_cache.set(user_id, True)
+        return is_member
     except Forbidden:
         logger.warning(f"Bot failed to check membership for {user_id}")
         return False
@@ -53,7 +131,7 @@ async def check_channel_membership(update: Update, context: ContextTypes.DEFAULT
 
 # --- Menu Functions ---
 
-def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
+def _build_main_menu(is_admin: bool) -> ReplyKeyboardMarkup:
     buttons = [
         ["دوره‌ها/بازدیدها 📅", "ویرایش مشخصات ✏️"],
         ["ارتباط با پشتیبانی 📞", "سوالات متداول ❓"],
@@ -63,69 +141,81 @@ def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
         buttons.insert(-1, ["منوی ادمین ⚙️"])
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
 
+# منوها ثابت‌اند؛ یک بار ساخته و در همه‌ی پاسخ‌ها استفاده می‌شوند
+_MAIN_MENU = _build_main_menu(is_admin=False)
+_MAIN_MENU_ADMIN = _build_main_menu(is_admin=True)
+_ADMIN_MENU = ReplyKeyboardMarkup([
+    ["اضافه کردن رویداد جدید ➕", "ویرایش رویدادها ✏️"],
+    ["غیرفعال/فعال کردن رویداد 🔄", "مدیریت ادمین‌ها 👤"],
+    ["اعلان عمومی 📢", "گزارش‌ها 📊"],
+    ["اضافه کردن دستی به ثبت‌نام 📋", "ارسال نظرسنجی 📊⭐"],
+    ["لغو/شروع دوباره 🚪", "بازگشت 🔙"]
+], resize_keyboard=True)
+
+def get_main_menu(is_admin: bool = False) -> ReplyKeyboardMarkup:
+    return _MAIN_MENU_ADMIN if is_admin else _MAIN_MENU
+
 def get_admin_menu() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup([
-        ["اضافه کردن رویداد جدید ➕", "ویرایش رویدادها ✏️"],
-        ["غیرفعال/فعال کردن رویداد 🔄", "مدیریت ادمین‌ها 👤"],
-        ["اعلان عمومی 📢", "گزارش‌ها 📊"],
-        ["اضافه کردن دستی به ثبت‌نام 📋", "ارسال نظرسنجی 📊⭐"],
-        ["لغو/شروع دوباره 🚪", "بازگشت 🔙"]
-    ], resize_keyboard=True)
-
-async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, full_name: str = None):
+    return _ADMIN_MENU
+
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, full_name: str = None, is_admin: bool = None):
     """Helper function to show the main menu."""
     user_id = update.effective_user.id
     if not full_name:
-        user_info = await db.get_user_info(user_id)
+        user_info, is_admin = await get_user_with_admin(user_id)
         full_name = user_info['full_name'] if user_info else "کاربر"
-    
-    admin_status = await is_user_admin(user_id)
-    await update.message.reply_text(
+    elif is_admin is None:
+        is_admin = await is_user_admin(user_id)
+    # برای callback query پیام حاوی دکمه، و برای پیام متنی خود پیام
+    await update.effective_message.reply_text(
         f"{full_name} عزیز، به ربات انجمن مهندسی شیمی خوش آمدید! 🎉",
-        reply_markup=get_main_menu(admin_status)
+        reply_markup=get_main_menu(is_admin)
     )
 
 # --- Basic Handlers ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    if not await check_channel_membership(update, context):
+    # بررسی عضویت (API تلگرام) و خواندن کاربر از دیتابیس هم‌زمان انجام می‌شوند
+    is_member, (user_info, is_admin) = await asyncio.gather(
+        check_channel_membership(update, context),
+        get_user_with_admin(user_id)
+    )
+    if not is_member:
         await update.message.reply_text(
             f"لطفاً ابتدا کانال رسمی را دنبال کنید: {CHANNEL_ID} 📢",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
-            ]])
+            reply_markup=MEMBERSHIP_MARKUP
         )
         return ConversationHandler.END
         
-    user_info = await db.get_user_info(user_id)
     if not user_info:
         await update.message.reply_text("لطفاً نام کامل خود را به فارسی وارد کنید (مثال: علی محمدی):")
         return ProfileState.FULL_NAME
     
-    await show_main_menu(update, context, user_info['full_name'])
+    await show_main_menu(update, context, user_info['full_name'], is_admin)
     return ConversationHandler.END
 
 async def check_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
-    if await check_channel_membership(update, context):
-        user_id = update.effective_user.id
-        user_info = await db.get_user_info(user_id)
+    user_id = update.effective_user.id
+    is_member, (user_info, is_admin) = await asyncio.gather(
+        check_channel_membership(update, context),
+        get_user_with_admin(user_id)
+    )
+    if is_member:
         if not user_info:
             await query.message.reply_text("لطفاً نام کامل خود را به فارسی وارد کنید (مثال: علی محمدی):")
             await query.message.delete()
             return ProfileState.FULL_NAME
         
-        await show_main_menu(update, context, user_info['full_name'])
+        await show_main_menu(update, context, user_info['full_name'], is_admin)
         await query.message.delete()
         return ConversationHandler.END
         
     await query.message.reply_text(
         f"شما هنوز عضو کانال نیستید. لطفاً ابتدا کانال را دنبال کنید: {CHANNEL_ID} 📢",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
-        ]])
+        reply_markup=MEMBERSHIP_MARKUP
     )
     return ConversationHandler.END
 
@@ -134,12 +224,12 @@ async def reset_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     context.user_data.clear()
     
-    user_info = await db.get_user_info(user_id)
+    user_info, is_admin = await get_user_with_admin(user_id)
     if not user_info:
         await update.message.reply_text("اطلاعات شما یافت نشد. لطفاً از ابتدا ثبت نام کنید.\nنام کامل خود را به فارسی وارد کنید (مثال: علی محمدی):")
         return ProfileState.FULL_NAME
         
-    await show_main_menu(update, context, user_info['full_name'])
+    await show_main_menu(update, context, user_info['full_name'], is_admin)
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -152,21 +242,23 @@ async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Returns to main menu, primarily for admin menu."""
     await show_main_menu(update, context)
 
+# متن ثابت؛ یک بار در سطح ماژول ساخته می‌شود
+_FAQ_TEXT = (
+    "❓ **سوالات متداول**\n\n"
+    "1️⃣ **چطور می‌توانم در رویدادها ثبت‌نام کنم؟**\n"
+    "از منوی اصلی، گزینه 'دوره‌ها/بازدیدها 📅' را انتخاب کنید...\n\n"
+    "2️⃣ **هزینه ثبت‌نام چطور پرداخت می‌شود؟**\n"
+    "پس از واریز مبلغ، تصویر رسید را ارسال کنید...\n\n"
+    "3️⃣ **چطور می‌توانم پروفایلم را ویرایش کنم؟**\n"
+    "از منوی اصلی، گزینه 'ویرایش مشخصات ✏️' را انتخاب کنید...\n\n"
+    "4️⃣ **اگر مشکلی داشتم با کجا تماس بگیرم؟**\n"
+    "از گزینه 'ارتباط با پشتیبانی 📞' استفاده کنید...\n\n"
+    "5️⃣ **چطور می‌توانم از وضعیت ثبت‌نامم مطمئن شوم؟**\n"
+    "پس از ثبت‌نام، تأییدیه‌ای دریافت خواهید کرد..."
+)
+
 async def faq(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    text = (
-        "❓ **سوالات متداول**\n\n"
-        "1️⃣ **چطور می‌توانم در رویدادها ثبت‌نام کنم؟**\n"
-        "از منوی اصلی، گزینه 'دوره‌ها/بازدیدها 📅' را انتخاب کنید...\n\n"
-        "2️⃣ **هزینه ثبت‌نام چطور پرداخت می‌شود؟**\n"
-        "پس از واریز مبلغ، تصویر رسید را ارسال کنید...\n\n"
-        "3️⃣ **چطور می‌توانم پروفایلم را ویرایش کنم؟**\n"
-        "از منوی اصلی، گزینه 'ویرایش مشخصات ✏️' را انتخاب کنید...\n\n"
-        "4️⃣ **اگر مشکلی داشتم با کجا تماس بگیرم؟**\n"
-        "از گزینه 'ارتباط با پشتیبانی 📞' استفاده کنید...\n\n"
-        "5️⃣ **چطور می‌توانم از وضعیت ثبت‌نامم مطمئن شوم؟**\n"
-        "پس از ثبت‌نام، تأییدیه‌ای دریافت خواهید کرد..."
-    )
-    await update.message.reply_text(text, reply_markup=get_main_menu(await is_user_admin(update.effective_user.id)))
+    await update.message.reply_text(_FAQ_TEXT, reply_markup=get_main_menu(await is_user_admin(update.effective_user.id)))
 
 async def unknown_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # TODO: این تابع باید به تابع پشتیبانی کامل تبدیل شود
@@ -179,166 +271,142 @@ async def unknown_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 # (این بخش طولانی است و در user_profile.py قرار می‌گیرد)
 # اما برای سادگی کار، فعلاً ConversationHandler اصلی ثبت‌نام را اینجا نگه می‌داریم
 
+# کیبورد «بله/خیر» هر مرحله‌ی فرم پروفایل
+_CONFIRM_MARKUPS = {
+    field: InlineKeyboardMarkup([[
+        InlineKeyboardButton("بله ✅", callback_data=f"confirm_{field}"),
+        InlineKeyboardButton("خیر ✏️", callback_data=f"retry_{field}")
+    ]])
+    for field in ("full_name", "national_id", "student_id", "phone")
+}
+
 async def full_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if not re.match(r"^[آ-ی\s]{6,}$", text) or text.count(" ") < 1:
+    if not validate_full_name(text):
         await update.message.reply_text("نام کامل باید حداقل 6 کاراکتر با حروف فارسی و شامل یک فاصله باشد. دوباره وارد کنید:")
         return ProfileState.FULL_NAME
     context.user_data["full_name"] = text
     await update.message.reply_text(
         f"آیا نام زیر درست است؟\n{text}",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("بله ✅", callback_data="confirm_full_name"),
-            InlineKeyboardButton("خیر ✏️", callback_data="retry_full_name")
-        ]])
+        reply_markup=_CONFIRM_MARKUPS["full_name"]
     )
     return ProfileState.CONFIRM_FULL_NAME
 
-async def confirm_full_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    if query.data == "retry_full_name":
-        await query.message.reply_text("لطفاً نام کامل خود را دوباره وارد کنید:")
-        await query.message.delete()
-        return ProfileState.FULL_NAME
-    await query.message.reply_text("لطفاً کد ملی 10 رقمی خود را وارد کنید:")
-    await query.message.delete()
-    return ProfileState.NATIONAL_ID
-
 async def national_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    text = update.message.text
+    text = normalize_national_id(update.message.text)
     if not validate_national_id(text):
         await update.message.reply_text("کد ملی نامعتبر است. لطفاً کد ملی 10 رقمی معتبر وارد کنید:")
         return ProfileState.NATIONAL_ID
     context.user_data["national_id"] = text
     await update.message.reply_text(
         f"آیا کد ملی زیر درست است؟\n{text}",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("بله ✅", callback_data="confirm_national_id"),
-            InlineKeyboardButton("خیر ✏️", callback_data="retry_national_id")
-        ]])
+        reply_markup=_CONFIRM_MARKUPS["national_id"]
     )
     return ProfileState.CONFIRM_NATIONAL_ID
 
-async def confirm_national_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    if query.data == "retry_national_id":
-        await query.message.reply_text("لطفاً کد ملی خود را دوباره وارد کنید:")
-        await query.message.delete()
-        return ProfileState.NATIONAL_ID
-    await query.message.reply_text("لطفاً شماره دانشجویی خود را وارد کنید:")
-    await query.message.delete()
-    return ProfileState.STUDENT_ID
-
 async def student_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     text = update.message.text
-    if not re.match(r"^\d+$", text):
+    if not validate_student_id(text):
         await update.message.reply_text("شماره دانشجویی باید فقط شامل اعداد باشد. دوباره وارد کنید:")
         return ProfileState.STUDENT_ID
     context.user_data["student_id"] = text
     await update.message.reply_text(
         f"آیا شماره دانشجویی زیر درست است؟\n{text}",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("بله ✅", callback_data="confirm_student_id"),
-            InlineKeyboardButton("خیر ✏️", callback_data="retry_student_id")
-        ]])
+        reply_markup=_CONFIRM_MARKUPS["student_id"]
     )
     return ProfileState.CONFIRM_STUDENT_ID
 
-async def confirm_student_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    query = update.callback_query
-    await query.answer()
-    if query.data == "retry_student_id":
-        await query.message.reply_text("لطفاً شماره دانشجویی خود را دوباره وارد کنید:")
-        await query.message.delete()
-        return ProfileState.STUDENT_ID
-    await query.message.reply_text(
-        "لطفاً شماره تماس خود را وارد کنید یا دکمه زیر را فشار دهید:",
-        reply_markup=ReplyKeyboardMarkup(
-            [[KeyboardButton("ارسال شماره تماس 📱", request_contact=True)]],
-            one_time_keyboard=True
-        )
-    )
-    await query.message.delete()
-    return ProfileState.PHONE
-
 async def phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.message.contact:
-        phone_num = update.message.contact.phone_number
-        phone_num = phone_num.replace("+98", "0") if phone_num.startswith("+98") else phone_num
+        phone_num = normalize_phone(update.message.contact.phone_number)
     else:
-        phone_num = update.message.text
-        if not re.match(r"^09\d{9}$", phone_num):
+        phone_num = normalize_phone(update.message.text)
+        if not validate_phone(phone_num):
             await update.message.reply_text("شماره تماس باید 11 رقم و با 09 شروع شود. دوباره وارد کنید:")
             return ProfileState.PHONE
     context.user_data["phone"] = phone_num
     await update.message.reply_text(
         f"آیا شماره تماس زیر درست است؟\n{phone_num}",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("بله ✅", callback_data="confirm_phone"),
-            InlineKeyboardButton("خیر ✏️", callback_data="retry_phone")
-        ]])
+        reply_markup=_CONFIRM_MARKUPS["phone"]
     )
     return ProfileState.CONFIRM_PHONE
 
-async def confirm_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+# مراحل تأیید فرم پروفایل: وضعیت، پیام و کیبورد بعد از «تلاش دوباره» و بعد از «تأیید»
+_CONTACT_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton("ارسال شماره تماس 📱", request_contact=True)]],
+    one_time_keyboard=True
+)
+_RETRY_STEPS = {
+    "full_name": (ProfileState.FULL_NAME, "لطفاً نام کامل خود را دوباره وارد کنید:", None),
+    "national_id": (ProfileState.NATIONAL_ID, "لطفاً کد ملی خود را دوباره وارد کنید:", None),
+    "student_id": (ProfileState.STUDENT_ID, "لطفاً شماره دانشجویی خود را دوباره وارد کنید:", None),
+    "phone": (ProfileState.PHONE, "لطفاً شماره تماس خود را دوباره وارد کنید...", _CONTACT_KEYBOARD),
+}
+_NEXT_STEPS = {
+    "full_name": (ProfileState.NATIONAL_ID, "لطفاً کد ملی 10 رقمی خود را وارد کنید:", None),
+    "national_id": (ProfileState.STUDENT_ID, "لطفاً شماره دانشجویی خود را وارد کنید:", None),
+    "student_id": (ProfileState.PHONE, "لطفاً شماره تماس خود را وارد کنید یا دکمه زیر را فشار دهید:", _CONTACT_KEYBOARD),
+}
+
+async def confirm_step(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Handles the confirm/retry buttons of every profile field."""
     query = update.callback_query
     await query.answer()
-    if query.data == "retry_phone":
-        await query.message.reply_text(
-            "لطفاً شماره تماس خود را دوباره وارد کنید...",
-            reply_markup=ReplyKeyboardMarkup(
-                [[KeyboardButton("ارسال شماره تماس 📱", request_contact=True)]],
-                one_time_keyboard=True
-            )
-        )
+    action, field = query.data.split("_", 1)
+    if action == "retry":
+        state, text, markup = _RETRY_STEPS[field]
+    elif field == "phone":
+        return await _create_profile(update, context)
+    else:
+        state, text, markup = _NEXT_STEPS[field]
+    if markup is None:
+        # یک درخواست edit به‌جای ارسال پیام جدید و حذف پیام قبلی
+        await query.edit_message_text(text)
+    else:
+        # کیبورد request_contact را فقط می‌توان با پیام جدید فرستاد
+        await query.message.reply_text(text, reply_markup=markup)
         await query.message.delete()
-        return ProfileState.PHONE
-        
+    return state
+
+def _confirm_handler(field: str) -> CallbackQueryHandler:
+    return CallbackQueryHandler(confirm_step, pattern=f"^(confirm|retry)_{field}$")
+
+async def _create_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
     user_id = update.effective_user.id
-    try:
-        async with await db.get_db_connection() as conn:
-            await conn.execute(
-                "INSERT INTO users (user_id, full_name, national_id, student_id, phone, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    user_id,
-                    context.user_data["full_name"],
-                    context.user_data["national_id"],
-                    context.user_data["student_id"],
-                    context.user_data["phone"],
-                    datetime.now().isoformat(),
-                )
-            )
-            await conn.commit()
-        
-        await query.message.reply_text("پروفایل شما با موفقیت ایجاد شد! ✅")
-        await show_main_menu(update, context, context.user_data["full_name"])
-        await query.message.delete()
-        return ConversationHandler.END
-    except Exception as e:
-        logger.error(f"Error creating profile for {user_id}: {e}")
-        await query.message.reply_text("خطایی در ایجاد پروفایل رخ داد. لطفاً دوباره تلاش کنید.")
+    created = await db.create_user(
+        user_id,
+        context.user_data["full_name"],
+        context.user_data["national_id"],
+        context.user_data["student_id"],
+        context.user_data["phone"],
+    )
+    if not created:
+        await query.edit_message_text("خطایی در ایجاد پروفایل رخ داد. لطفاً دوباره تلاش کنید.")
         return ConversationHandler.END
 
+    await query.edit_message_text("پروفایل شما با موفقیت ایجاد شد! ✅")
+    await show_main_menu(update, context, context.user_data["full_name"])
+    return ConversationHandler.END
+
 # --- Conversation Handler Definitions ---
 profile_conv = ConversationHandler(
     entry_points=[
         CommandHandler("start", start),
-        MessageHandler(filters.Regex("^(لغو/شروع دوباره 🚪)$"), reset_bot)
+        MessageHandler(filters.Text(["لغو/شروع دوباره 🚪"]), reset_bot)
     ],
     states={
         ProfileState.FULL_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, full_name)],
-        ProfileState.CONFIRM_FULL_NAME: [CallbackQueryHandler(confirm_full_name, pattern="^(confirm_full_name|retry_full_name)$")],
+        ProfileState.CONFIRM_FULL_NAME: [_confirm_handler("full_name")],
         ProfileState.NATIONAL_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, national_id)],
-        ProfileState.CONFIRM_NATIONAL_ID: [CallbackQueryHandler(confirm_national_id, pattern="^(confirm_national_id|retry_national_id)$")],
+        ProfileState.CONFIRM_NATIONAL_ID: [_confirm_handler("national_id")],
         ProfileState.STUDENT_ID: [MessageHandler(filters.TEXT & ~filters.COMMAND, student_id)],
-        ProfileState.CONFIRM_STUDENT_ID: [CallbackQueryHandler(confirm_student_id, pattern="^(confirm_student_id|retry_student_id)$")],
+        ProfileState.CONFIRM_STUDENT_ID: [_confirm_handler("student_id")],
         ProfileState.PHONE: [
             MessageHandler(filters.CONTACT, phone),
             MessageHandler(filters.TEXT & ~filters.COMMAND, phone)
         ],
-        ProfileState.CONFIRM_PHONE: [CallbackQueryHandler(confirm_phone, pattern="^(confirm_phone|retry_phone)$")],
+        ProfileState.CONFIRM_PHONE: [_confirm_handler("phone")],
     },
     fallbacks=[CommandHandler("cancel", cancel)],
     per_message=False
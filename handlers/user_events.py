@@ -1,53 +1,79 @@
 # handlers/user_events.py
 import logging
-from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 import database as db
+from broadcast import group_rate_limit, GroupMessageQueue, MAX_MESSAGE_LENGTH
 from config import CHANNEL_ID, CARD_NUMBER, OPERATOR_GROUP_ID
-from handlers.common import check_channel_membership, is_user_admin
+from handlers.common import check_channel_membership, is_user_admin, MEMBERSHIP_MARKUP
 
 logger = logging.getLogger(__name__)
 
+async def _log_operator_batch(message, metas) -> None:
+    """پیام ادغام‌شده‌ی گروه اپراتورها را ثبت می‌کند؛ برای هر ثبت‌نام داخل پیام یک ردیف."""
+    await db.log_operator_messages([
+        (message.message_id, OPERATOR_GROUP_ID, user_id, event_id, message_type)
+        for user_id, event_id, message_type in metas
+    ])
+
+# پیام‌های ثبت‌نام و لیست نهایی از این صف و با رعایت محدودیت نرخ گروه ارسال می‌شوند
+operator_queue = GroupMessageQueue(OPERATOR_GROUP_ID, on_sent=_log_operator_batch)
+
+def _processed_markup(status: str) -> InlineKeyboardMarkup:
+    """
+    نتیجه‌ی رسیدگی به رسید روی دکمه‌ی «حذف پیام» نوشته می‌شود تا فقط کیبورد ویرایش شود
+    (edit_reply_markup) و کپشن و عکس دوباره برای تلگرام ارسال نشوند.
+    """
+    return InlineKeyboardMarkup([[InlineKeyboardButton(f"{status} | حذف پیام 🗑", callback_data="done")]])
+
+_ALREADY_CONFIRMED_MARKUP = _processed_markup("✅ قبلاً تأیید شده بود")
+_EVENT_FULL_MARKUP = _processed_markup("📪 ظرفیت تکمیل بود")
+
+# اقدامات مرحله‌ی اول روی رسید؛ مرحله‌ی دوم همان اقدام با پیشوند confirm_ است
+_PAYMENT_ACTION_LABELS = {
+    "confirm_payment": "تأیید ✅",
+    "unclear_payment": "ناخوانا 📸",
+    "cancel_payment": "ابطال 🚫",
+}
+
 async def deactivate_event(event_id: int, reason: str, context: ContextTypes.DEFAULT_TYPE):
     """
     رویداد را غیرفعال می‌کند و لیست نهایی ثبت‌نام‌کنندگان را به گروه اپراتورها ارسال می‌کند.
     """
     try:
-        async with await db.get_db_connection() as conn:
-            # 1. غیرفعال کردن رویداد
-            await conn.execute(
-                "UPDATE events SET is_active = 0, deactivation_reason = ? WHERE event_id = ?",
-                (reason, event_id)
-            )
-            event = await db.get_event_details(event_id)
-            registrations = await db.get_event_participants(event_id)
-            await conn.commit()
-            
-            # 2. آماده‌سازی و ارسال لیست نهایی
-            users = []
-            for reg in registrations:
-                user = await db.get_user_info(reg['user_id'])
-                if user:
-                    users.append(f"- {user['full_name']} ({user['phone']})")
+        # 1. غیرفعال کردن رویداد
+        if not await db.set_event_inactive(event_id, reason):
+            return
+        event = await db.get_event_details(event_id)
+        # نام و تلفن همه‌ی شرکت‌کنندگان با یک کوئری JOIN (به‌جای یک کوئری برای هر نفر)
+        roster = await db.get_event_roster(event_id)
+
+        # 2. آماده‌سازی و ارسال لیست نهایی
+        users = [f"- {full_name} ({phone})" for full_name, phone in roster]
+
+        header = (
+            f"{event['hashtag_prefix']}\n"
+            f"#نهایی\n"
+            f"تعداد ثبت‌نام‌کنندگان: {len(users)}"
+        )
+        text = f"{header}\n{' '.join(users)}"
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            # 3. ارسال از صف گروه (بعد از پیام‌های ثبت‌نامی که قبل از آن در صف هستند)؛ لاگ در on_sent ثبت می‌شود
+            operator_queue.put(context.bot, text, (None, event_id, "final_list"))
+        else:
+            # 3. لیست طولانی از سقف طول پیام تلگرام بیشتر است و به‌صورت یک فایل متنی ارسال می‌شود
+            await operator_queue.drain()
+            async with group_rate_limit(OPERATOR_GROUP_ID):
+                message = await context.bot.send_document(
+                    OPERATOR_GROUP_ID,
+                    document="\n".join(users).encode("utf-8"),
+                    filename=f"event_{event_id}.txt",
+                    caption=header
+                )
+            await db.log_operator_message(message.message_id, OPERATOR_GROUP_ID, None, event_id, "final_list")
+        logger.info(f"Event {event_id} deactivated. Reason: {reason}")
 
-            text = (
-                f"#{event['type']} #{event['hashtag'].replace(' ', '_')}\n"
-                f"#نهایی\n"
-                f"تعداد ثبت‌نام‌کنندگان: {len(users)}\n"
-                f"{' '.join(users)}"
-            )
-            message = await context.bot.send_message(OPERATOR_GROUP_ID, text)
-            
-            # 3. ثبت پیام در دیتابیس
-            await conn.execute(
-                "INSERT INTO operator_messages (message_id, chat_id, user_id, event_id, message_type, sent_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (message.message_id, OPERATOR_GROUP_ID, 0, event_id, "final_list", datetime.now().isoformat())
-            )
-            await conn.commit()
-            logger.info(f"Event {event_id} deactivated. Reason: {reason}")
-            
     except Exception as e:
         logger.error(f"Error deactivating event {event_id}: {e}")
 
@@ -60,21 +86,18 @@ async def show_events(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if not await check_channel_membership(update, context):
         await message.reply_text(
             f"لطفاً ابتدا کانال رسمی را دنبال کنید: {CHANNEL_ID} 📢",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
-            ]])
+            reply_markup=MEMBERSHIP_MARKUP
         )
         return
         
-    async with await db.get_db_connection() as conn:
-        async with conn.execute("SELECT event_id, title, type FROM events WHERE is_active = 1") as cursor:
-            events = await cursor.fetchall()
+    buttons = [
+        [InlineKeyboardButton(f"{event['title']} ({event['type']})", callback_data=f"event_{event['event_id']}")]
+        async for event in db.iter_all_events(active_only=True)
+    ]
             
-    if not events:
+    if not buttons:
         await message.reply_text("در حال حاضر دوره یا بازدید فعالی وجود ندارد. 📪")
         return
-        
-    buttons = [[InlineKeyboardButton(f"{event['title']} ({event['type']})", callback_data=f"event_{event['event_id']}")] for event in events]
     
     # اگر از دکمه 'بازگشت' استفاده شده، پیام قبلی را ویرایش کن
     if update.callback_query and update.callback_query.data == "back_to_events":
@@ -92,7 +115,7 @@ async def event_details(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     """جزئیات یک رویداد خاص را نمایش می‌دهد."""
     query = update.callback_query
     await query.answer()
-    event_id = int(query.data.split("_")[1])
+    event_id = int(query.data.removeprefix("event_"))
     
     event = await db.get_event_details(event_id)
             
@@ -131,83 +154,70 @@ async def register_event(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not await check_channel_membership(update, context):
         await query.message.reply_text(
             f"لطفاً ابتدا کانال رسمی را دنبال کنید: {CHANNEL_ID} 📢",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
-            ]])
+            reply_markup=MEMBERSHIP_MARKUP
         )
         return
         
-    event_id = int(query.data.split("_")[1])
+    event_id = int(query.data.removeprefix("register_"))
     user_id = update.effective_user.id
     
     try:
-        async with await db.get_db_connection() as conn:
-            event = await db.get_event_details(event_id)
-            user = await db.get_user_info(user_id)
-            
-            if not event or not user:
-                await query.message.reply_text("خطا: اطلاعات رویداد یا کاربر یافت نشد. آیا پروفایل شما تکمیل است؟")
-                return
+        event = await db.get_event_details(event_id)
+        user = await db.get_user_info(user_id)
+        
+        if not event or not user:
+            await query.message.reply_text("خطا: اطلاعات رویداد یا کاربر یافت نشد. آیا پروفایل شما تکمیل است؟")
+            return
 
-            # بررسی تکرار ثبت‌نام
-            async with conn.execute("SELECT * FROM registrations WHERE user_id = ? AND event_id = ?", (user_id, event_id)) as cursor:
-                if await cursor.fetchone():
-                    await query.message.reply_text("شما قبلاً ثبت‌نام کرده‌اید! 📋")
-                    return
-            
-            if not event['is_active']:
-                await query.message.reply_text(f"رویداد غیرفعال شده است. دلیل: {event['deactivation_reason']}")
+        if not event['is_active']:
+            await query.message.reply_text(f"رویداد غیرفعال شده است. دلیل: {event['deactivation_reason']}")
+            return
+        
+        # بررسی سریع ظرفیت از روی کش؛ بررسی قطعی در خود تراکنش ثبت‌نام انجام می‌شود
+        if event['type'] != "دوره" and event['current_capacity'] >= event['capacity']:
+            await query.message.reply_text("ظرفیت تکمیل شده است. 📪")
+            return
+
+        # رویداد رایگان
+        if event['cost'] == 0:
+            # تکرار ثبت‌نام و ظرفیت به صورت اتمیک در register_user بررسی می‌شوند
+            result = await db.register_user(user_id, event_id)
+            if result is None:
+                await query.message.reply_text("خطایی در فرآیند ثبت‌نام رخ داد. لطفاً دوباره تلاش کنید.")
                 return
-            
-            # بررسی ظرفیت
-            if event['type'] != "دوره" and event['current_capacity'] >= event['capacity']:
+            reg_count, filled = result
+            if reg_count == 0:
+                await query.message.reply_text("شما قبلاً ثبت‌نام کرده‌اید! 📋")
+                return
+            if reg_count == db.EVENT_FULL:
                 await query.message.reply_text("ظرفیت تکمیل شده است. 📪")
                 return
 
-            # رویداد رایگان
-            if event['cost'] == 0:
-                await conn.execute(
-                    "INSERT INTO registrations (user_id, event_id, registered_at) VALUES (?, ?, ?)",
-                    (user_id, event_id, datetime.now().isoformat())
-                )
-                await conn.execute(
-                    "UPDATE events SET current_capacity = current_capacity + 1 WHERE event_id = ?",
-                    (event_id,)
-                )
-                
-                async with conn.execute("SELECT COUNT(*) FROM registrations WHERE event_id = ?", (event_id,)) as cursor:
-                    reg_count = (await cursor.fetchone())[0]
-                
-                await conn.commit()
-
-                # ارسال اطلاعات ثبت‌نام به گروه اپراتور
-                hashtag = f"#{event['type']} #{event['hashtag'].replace(' ', '_')}"
-                text = (
-                    f"{hashtag}\n{reg_count}:\n"
-                    f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
-                    f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}"
-                )
-                message = await context.bot.send_message(OPERATOR_GROUP_ID, text)
-                
-                await conn.execute(
-                    "INSERT INTO operator_messages (message_id, chat_id, user_id, event_id, message_type, sent_at) VALUES (?, ?, ?, ?, ?, ?)",
-                    (message.message_id, OPERATOR_GROUP_ID, user_id, event_id, "registration", datetime.now().isoformat())
-                )
-                await conn.commit()
+            # ارسال اطلاعات ثبت‌نام به گروه اپراتور
+            hashtag = event['hashtag_prefix']
+            text = (
+                f"{hashtag}\n{reg_count}:\n"
+                f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
+                f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}"
+            )
+            operator_queue.put(context.bot, text, (user_id, event_id, "registration"))
 
-                await query.message.reply_text("ثبت‌نام شما با موفقیت انجام شد! ✅")
-                
-                # بررسی تکمیل ظرفیت بعد از ثبت‌نام
-                if event['type'] != "دوره" and event['current_capacity'] + 1 >= event['capacity']:
-                    await deactivate_event(event_id, "تکمیل ظرفیت", context)
+            await query.message.reply_text("ثبت‌نام شما با موفقیت انجام شد! ✅")
             
-            # رویداد پولی
-            else:
-                context.user_data["pending_event_id"] = event_id
-                await query.message.reply_text(
-                    f"برای تکمیل ثبت‌نام در {event['title']}، لطفاً مبلغ **{event['cost']:,} تومان** را به شماره کارت زیر واریز کنید:\n\n`{CARD_NUMBER}`\n\n"
-                    f"سپس **تصویر رسید پرداخت** را در همین چت ارسال کنید. 📸"
-                )
+            # بررسی تکمیل ظرفیت بعد از ثبت‌نام
+            if filled:
+                await deactivate_event(event_id, "تکمیل ظرفیت", context)
+        
+        # رویداد پولی
+        else:
+            if await db.is_registered(user_id, event_id):
+                await query.message.reply_text("شما قبلاً ثبت‌نام کرده‌اید! 📋")
+                return
+            context.user_data["pending_event_id"] = event_id
+            await query.message.reply_text(
+                f"برای تکمیل ثبت‌نام در {event['title']}، لطفاً مبلغ **{event['cost']:,} تومان** را به شماره کارت زیر واریز کنید:\n\n`{CARD_NUMBER}`\n\n"
+                f"سپس **تصویر رسید پرداخت** را در همین چت ارسال کنید. 📸"
+            )
 
     except Exception as e:
         logger.error(f"Error during registration for user {user_id} event {event_id}: {e}")
@@ -223,42 +233,38 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
     user_id = update.effective_user.id
     
     try:
-        async with await db.get_db_connection() as conn:
-            event = await db.get_event_details(event_id)
-            user = await db.get_user_info(user_id)
-            
-            if not event or not user:
-                await update.message.reply_text("خطا: اطلاعات رویداد یا کاربر یافت نشد.")
-                return
+        event = await db.get_event_details(event_id)
+        user = await db.get_user_info(user_id)
+        
+        if not event or not user:
+            await update.message.reply_text("خطا: اطلاعات رویداد یا کاربر یافت نشد.")
+            return
 
-            text = (
-                f"#{event['type']} #{event['hashtag'].replace(' ', '_')}\n"
-                f"**درخواست تأیید پرداخت**\n"
-                f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
-                f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}\n"
-                f"مبلغ: {event['cost']:,} تومان"
-            )
-            buttons = [
-                [InlineKeyboardButton("تأیید ✅", callback_data=f"confirm_payment_{user_id}_{event_id}")],
-                [
-                    InlineKeyboardButton("ناخوانا 📸", callback_data=f"unclear_payment_{user_id}_{event_id}"),
-                    InlineKeyboardButton("ابطال 🚫", callback_data=f"cancel_payment_{user_id}_{event_id}")
-                ]
+        text = (
+            f"{event['hashtag_prefix']}\n"
+            f"**درخواست تأیید پرداخت**\n"
+            f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
+            f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}\n"
+            f"مبلغ: {event['cost']:,} تومان"
+        )
+        buttons = [
+            [InlineKeyboardButton("تأیید ✅", callback_data=f"confirm_payment_{user_id}_{event_id}")],
+            [
+                InlineKeyboardButton("ناخوانا 📸", callback_data=f"unclear_payment_{user_id}_{event_id}"),
+                InlineKeyboardButton("ابطال 🚫", callback_data=f"cancel_payment_{user_id}_{event_id}")
             ]
-            
+        ]
+        
+        async with group_rate_limit(OPERATOR_GROUP_ID):
             message = await context.bot.send_photo(
                 OPERATOR_GROUP_ID,
                 update.message.photo[-1].file_id,
                 caption=text,
                 reply_markup=InlineKeyboardMarkup(buttons)
             )
-            
-            await conn.execute(
-                "INSERT INTO operator_messages (message_id, chat_id, user_id, event_id, message_type, sent_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (message.message_id, OPERATOR_GROUP_ID, user_id, event_id, "payment", datetime.now().isoformat())
-            )
-            await conn.commit()
-            
+        
+        await db.log_operator_message(message.message_id, OPERATOR_GROUP_ID, user_id, event_id, "payment")
+
         await update.message.reply_text("رسید شما ارسال شد و در انتظار تأیید ادمین‌ها است. ✅")
         del context.user_data["pending_event_id"] # حذف حالت انتظار
         
@@ -266,6 +272,11 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
         logger.error(f"Error handling payment receipt for {user_id} event {event_id}: {e}")
         await update.message.reply_text("خطایی در ارسال رسید رخ داد. لطفاً دوباره تلاش کنید.")
 
+async def _reply_already_confirmed(query, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """به کاربر و ادمین اطلاع می‌دهد که ثبت‌نام قبلاً تأیید شده بود."""
+    await context.bot.send_message(user_id, "ثبت‌نام شما قبلاً تأیید و تکمیل شده بود! ✅")
+    await query.message.edit_reply_markup(_ALREADY_CONFIRMED_MARKUP)
+
 async def payment_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """مدیریت اقدامات ادمین (تأیید/ابطال) روی رسیدهای پرداخت."""
     query = update.callback_query
@@ -275,105 +286,87 @@ async def payment_action(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     await query.answer()
-    callback_parts = query.data.split("_")
-    action = callback_parts[0]
 
     # دکمه 'بازگشت' یا 'انجام شد' (برای حذف پیام ادمین)
-    if action == "done":
+    if query.data == "done":
         await query.message.delete()
         return
 
     try:
+        # callback_data: {action}_{user_id}_{event_id}؛ خود action هم شامل '_' است
+        action, user_id, event_id = query.data.rsplit("_", 2)
+        user_id = int(user_id)
+        event_id = int(event_id)
+        sub_action = action.removeprefix("confirm_")
+
         # مدیریت دکمه‌های مرحله دوم (تأیید نهایی)
-        if action == "confirm" and len(callback_parts) >= 5:
-            sub_action = callback_parts[1]
-            user_id = int(callback_parts[3])
-            event_id = int(callback_parts[4])
+        if action not in _PAYMENT_ACTION_LABELS and sub_action in _PAYMENT_ACTION_LABELS:
+            admin_name = update.effective_user.full_name
 
-            async with await db.get_db_connection() as conn:
-                event = await db.get_event_details(event_id)
-                user = await db.get_user_info(user_id)
+            event = await db.get_event_details(event_id)
+            user = await db.get_user_info(user_id)
 
-                if not event or not user:
-                    await query.message.edit_caption(caption="خطا: رویداد یا کاربر یافت نشد.")
-                    return
+            if not event or not user:
+                await query.message.edit_caption(caption="خطا: رویداد یا کاربر یافت نشد.")
+                return
 
-                # اگر کاربر قبلا ثبت‌نام کرده، دوباره ثبت‌نام نکن
-                async with conn.execute("SELECT * FROM registrations WHERE user_id = ? AND event_id = ?", (user_id, event_id)) as cursor:
-                    if await cursor.fetchone():
-                        await context.bot.send_message(user_id, "ثبت‌نام شما قبلاً تأیید و تکمیل شده بود! ✅")
-                        await query.message.edit_caption(caption=f"{query.message.caption}\n\n**✅ قبلاً تأیید شده بود. **", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("حذف پیام", callback_data="done")]]))
-                        return
-
-                if sub_action == "confirm_payment":
-                    # ثبت‌نام در جدول registrations
-                    await conn.execute(
-                        "INSERT INTO registrations (user_id, event_id, registered_at) VALUES (?, ?, ?)",
-                        (user_id, event_id, datetime.now().isoformat())
-                    )
-                    # ثبت پرداخت در جدول payments
-                    await conn.execute(
-                        "INSERT INTO payments (user_id, event_id, amount, confirmed_at) VALUES (?, ?, ?, ?)",
-                        (user_id, event_id, event['cost'], datetime.now().isoformat())
-                    )
-                    # به‌روزرسانی ظرفیت
-                    await conn.execute(
-                        "UPDATE events SET current_capacity = current_capacity + 1 WHERE event_id = ?",
-                        (event_id,)
-                    )
-                    async with conn.execute("SELECT COUNT(*) FROM registrations WHERE event_id = ?", (event_id,)) as cursor:
-                        reg_count = (await cursor.fetchone())[0]
-                    await conn.commit()
-                    
-                    # ارسال لیست ثبت‌نام جدید به اپراتور
-                    hashtag = f"#{event['type']} #{event['hashtag'].replace(' ', '_')}"
-                    text = (
-                        f"{hashtag}\n{reg_count}:\n"
-                        f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
-                        f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}"
-                    )
-                    message_log = await context.bot.send_message(OPERATOR_GROUP_ID, text)
-                    
-                    # ثبت پیام لاگ در دیتابیس
-                    await conn.execute(
-                        "INSERT INTO operator_messages (message_id, chat_id, user_id, event_id, message_type, sent_at) VALUES (?, ?, ?, ?, ?, ?)",
-                        (message_log.message_id, OPERATOR_GROUP_ID, user_id, event_id, "registration", datetime.now().isoformat())
-                    )
-                    await conn.commit()
-
-                    await context.bot.send_message(user_id, f"پرداخت شما برای {event['title']} تأیید شد و ثبت‌نام شما تکمیل شد! ✅")
-                    
-                    # بررسی و غیرفعال کردن در صورت تکمیل ظرفیت
-                    if event['type'] != "دوره" and event['current_capacity'] + 1 >= event['capacity']:
-                        await deactivate_event(event_id, "تکمیل ظرفیت", context)
-                        
-                    await query.message.edit_caption(caption=f"{query.message.caption}\n\n**✅ توسط ادمین {update.effective_user.full_name} تأیید نهایی شد.**", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("حذف پیام", callback_data="done")]]))
+            # اگر کاربر قبلا ثبت‌نام کرده، دوباره ثبت‌نام نکن
+            # (در تأیید پرداخت، تکرار ثبت‌نام در خود تراکنش register_user تشخیص داده می‌شود)
+            if sub_action != "confirm_payment" and await db.is_registered(user_id, event_id):
+                await _reply_already_confirmed(query, context, user_id)
+                return
+
+            if sub_action == "confirm_payment":
+                # ثبت‌نام، بررسی ظرفیت، ثبت پرداخت و به‌روزرسانی ظرفیت در یک تراکنش
+                result = await db.register_user(user_id, event_id, amount=event['cost'])
+                if result is None:
+                    await query.message.edit_caption(caption="خطا در ثبت‌نام کاربر. لطفاً دوباره تلاش کنید.")
+                    return
+                reg_count, filled = result
+                if reg_count == 0:
+                    await _reply_already_confirmed(query, context, user_id)
+                    return
+                if reg_count == db.EVENT_FULL:
+                    await context.bot.send_message(user_id, f"متأسفانه ظرفیت {event['title']} تکمیل شده است. 📪")
+                    await query.message.edit_reply_markup(_EVENT_FULL_MARKUP)
+                    return
                 
-                elif sub_action == "unclear_payment":
-                    await context.bot.send_message(
-                        user_id,
-                        f"رسید تراکنش شما برای رویداد {event['title']} ناخوانا یا غیرقابل بررسی بود. لطفاً رسید تراکنش‌تون رو دوباره آپلود کنید."
-                    )
-                    await query.message.edit_caption(caption=f"{query.message.caption}\n\n**📸 توسط ادمین {update.effective_user.full_name} ناخوانا اعلام شد.**", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("حذف پیام", callback_data="done")]]))
+                # ارسال لیست ثبت‌نام جدید به اپراتور
+                hashtag = event['hashtag_prefix']
+                text = (
+                    f"{hashtag}\n{reg_count}:\n"
+                    f"نام: {user['full_name']}\nکد ملی: {user['national_id']}\n"
+                    f"شماره دانشجویی: {user['student_id']}\nشماره تماس: {user['phone']}"
+                )
+                operator_queue.put(context.bot, text, (user_id, event_id, "registration"))
+
+                await context.bot.send_message(user_id, f"پرداخت شما برای {event['title']} تأیید شد و ثبت‌نام شما تکمیل شد! ✅")
                 
-                elif sub_action == "cancel_payment":
-                    await context.bot.send_message(
-                        user_id,
-                        f"پرداخت شما برای رویداد {event['title']} تأیید نشد. لطفاً فرآیند ثبت‌نام را دوباره انجام دهید."
-                    )
-                    await query.message.edit_caption(caption=f"{query.message.caption}\n\n**🚫 توسط ادمین {update.effective_user.full_name} ابطال شد.**", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("حذف پیام", callback_data="done")]]))
+                # بررسی و غیرفعال کردن در صورت تکمیل ظرفیت
+                if filled:
+                    await deactivate_event(event_id, "تکمیل ظرفیت", context)
+                    
+                await query.message.edit_reply_markup(_processed_markup(f"✅ تأیید نهایی: {admin_name}"))
+            
+            elif sub_action == "unclear_payment":
+                await context.bot.send_message(
+                    user_id,
+                    f"رسید تراکنش شما برای رویداد {event['title']} ناخوانا یا غیرقابل بررسی بود. لطفاً رسید تراکنش‌تون رو دوباره آپلود کنید."
+                )
+                await query.message.edit_reply_markup(_processed_markup(f"📸 ناخوانا: {admin_name}"))
+            
+            elif sub_action == "cancel_payment":
+                await context.bot.send_message(
+                    user_id,
+                    f"پرداخت شما برای رویداد {event['title']} تأیید نشد. لطفاً فرآیند ثبت‌نام را دوباره انجام دهید."
+                )
+                await query.message.edit_reply_markup(_processed_markup(f"🚫 ابطال: {admin_name}"))
         
         # مدیریت دکمه‌های مرحله اول (تأیید، ناخوانا، ابطال) - مرحله پیش از تأیید نهایی
-        elif len(callback_parts) == 3 and action in ["confirm_payment", "unclear_payment", "cancel_payment"]:
-            user_id = int(callback_parts[1])
-            event_id = int(callback_parts[2])
-            action_label = {
-                "confirm_payment": "تأیید ✅",
-                "unclear_payment": "ناخوانا 📸",
-                "cancel_payment": "ابطال 🚫"
-            }[action]
+        elif action in _PAYMENT_ACTION_LABELS:
+            action_label = _PAYMENT_ACTION_LABELS[action]
             
-            # جلوگیری از انجام عملیات تکراری توسط ادمین‌های مختلف
+            # جلوگیری از انجام عملیات تکراری توسط ادمین‌های مختلف (رسیدهایی که نتیجه در کپشن آن‌ها نوشته شده)
             caption = query.message.caption
             if "تأیید نهایی شد" in caption or "ابطال شد" in caption:
                  await query.answer("این رسید قبلاً توسط ادمین دیگری پردازش شده است.", show_alert=True)
@@ -1,7 +1,5 @@
 # handlers/user_profile.py
-import re
 import logging
-from enum import Enum, auto
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (
     MessageHandler, CallbackQueryHandler, ConversationHandler, filters, ContextTypes, CommandHandler
@@ -9,24 +7,34 @@ from telegram.ext import (
 
 import database as db
 from handlers.common import (
-    check_channel_membership, get_main_menu, cancel, is_user_admin, 
-    validate_national_id, ProfileState, CHANNEL_ID
+    check_channel_membership, get_main_menu, cancel, is_user_admin,
+    validate_national_id, validate_full_name, validate_student_id, validate_phone,
+    normalize_phone, normalize_national_id, ProfileState, CHANNEL_ID, MEMBERSHIP_MARKUP
 )
 
 logger = logging.getLogger(__name__)
 
-class EditProfileState(Enum):
-    CHOOSE_FIELD = auto()
-    GET_VALUE = auto()
+class EditProfileState:
+    CHOOSE_FIELD, GET_VALUE = range(2)
+
+_EDIT_FIELD_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("ویرایش نام ✏️", callback_data="edit_full_name")],
+    [InlineKeyboardButton("ویرایش کد ملی ✏️", callback_data="edit_national_id")],
+    [InlineKeyboardButton("ویرایش شماره دانشجویی ✏️", callback_data="edit_student_id")],
+    [InlineKeyboardButton("ویرایش شماره تماس ✏️", callback_data="edit_phone")],
+    [InlineKeyboardButton("لغو 🚫", callback_data="cancel_edit")]
+])
+_PHONE_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton("ارسال شماره تماس 📱", request_contact=True)]],
+    one_time_keyboard=True
+)
 
 async def edit_profile_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
     if not await check_channel_membership(update, context):
         await update.message.reply_text(
             f"لطفاً ابتدا کانال رسمی را دنبال کنید: {CHANNEL_ID} 📢",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("عضو شدم ✅", callback_data="check_membership")
-            ]])
+            reply_markup=MEMBERSHIP_MARKUP
         )
         return ConversationHandler.END
         
@@ -42,14 +50,7 @@ async def edit_profile_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"شماره دانشجویی: {user_info['student_id']}\n"
         f"شماره تماس: {user_info['phone']}"
     )
-    buttons = [
-        [InlineKeyboardButton("ویرایش نام ✏️", callback_data="edit_full_name")],
-        [InlineKeyboardButton("ویرایش کد ملی ✏️", callback_data="edit_national_id")],
-        [InlineKeyboardButton("ویرایش شماره دانشجویی ✏️", callback_data="edit_student_id")],
-        [InlineKeyboardButton("ویرایش شماره تماس ✏️", callback_data="edit_phone")],
-        [InlineKeyboardButton("لغو 🚫", callback_data="cancel_edit")]
-    ]
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    await update.message.reply_text(text, reply_markup=_EDIT_FIELD_MARKUP)
     return EditProfileState.CHOOSE_FIELD
 
 async def edit_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -74,10 +75,7 @@ async def edit_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     if query.data == "edit_phone":
         await query.message.reply_text(
             f"لطفاً {field_name} جدید را وارد کنید یا دکمه زیر را فشار دهید:",
-            reply_markup=ReplyKeyboardMarkup(
-                [[KeyboardButton("ارسال شماره تماس 📱", request_contact=True)]],
-                one_time_keyboard=True
-            )
+            reply_markup=_PHONE_KEYBOARD
         )
     else:
         await query.message.reply_text(f"لطفاً {field_name} جدید را وارد کنید:")
@@ -103,40 +101,34 @@ async def edit_profile_value(update: Update, context: ContextTypes.DEFAULT_TYPE)
     try:
         if field_key == "edit_full_name":
             value = update.message.text
-            if not re.match(r"^[آ-ی\s]{6,}$", value) or value.count(" ") < 1:
+            if not validate_full_name(value):
                 await update.message.reply_text("نام کامل باید حداقل 6 کاراکتر با حروف فارسی و شامل یک فاصله باشد. دوباره وارد کنید:")
                 return EditProfileState.GET_VALUE
         
         elif field_key == "edit_national_id":
-            value = update.message.text
+            value = normalize_national_id(update.message.text)
             if not validate_national_id(value):
                 await update.message.reply_text("کد ملی نامعتبر است. لطفاً کد ملی 10 رقمی معتبر وارد کنید:")
                 return EditProfileState.GET_VALUE
         
         elif field_key == "edit_student_id":
             value = update.message.text
-            if not re.match(r"^\d+$", value):
+            if not validate_student_id(value):
                 await update.message.reply_text("شماره دانشجویی باید فقط شامل اعداد باشد. دوباره وارد کنید:")
                 return EditProfileState.GET_VALUE
         
         elif field_key == "edit_phone":
             if update.message.contact:
-                value = update.message.contact.phone_number
-                value = value.replace("+98", "0") if value.startswith("+98") else value
+                value = normalize_phone(update.message.contact.phone_number)
             else:
-                value = update.message.text
-            if not re.match(r"^09\d{9}$", value):
+                value = normalize_phone(update.message.text)
+            if not validate_phone(value):
                 await update.message.reply_text("شماره تماس باید 11 رقم و با 09 شروع شود. دوباره وارد کنید:")
                 return EditProfileState.GET_VALUE
         
         # Update database
         if db_field and value:
-            success = await db.update_event_field(user_id, db_field, value) # Note: This function name is wrong in DB, should be update_user_field
-            # Let's fix this logic here
-            async with await db.get_db_connection() as conn:
-                 await conn.execute(f"UPDATE users SET {db_field} = ? WHERE user_id = ?", (value, user_id))
-                 await conn.commit()
-            success = True # Assume success if no exception
+            success = await db.update_user_field(user_id, db_field, value)
             
             if not success:
                  raise Exception(f"Failed to update {db_field}")
@@ -152,7 +144,7 @@ async def edit_profile_value(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 edit_profile_conv = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(ویرایش مشخصات ✏️)$"), edit_profile_start)],
+    entry_points=[MessageHandler(filters.Text(["ویرایش مشخصات ✏️"]), edit_profile_start)],
     states={
         EditProfileState.CHOOSE_FIELD: [CallbackQueryHandler(edit_profile, pattern="^(edit_|cancel_edit)"), ],
         EditProfileState.GET_VALUE: [
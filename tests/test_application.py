@@ -0,0 +1,87 @@
+import asyncio
+import datetime
+import os
+import unittest
+from unittest import mock
+
+from telegram import Chat, Message, Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from application import ChatOrderedApplication, MAX_CONCURRENT_UPDATES, SUPPORTED_PTB_VERSION
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    message = Message(
+        message_id=update_id,
+        date=datetime.datetime.now(datetime.timezone.utc),
+        chat=Chat(id=chat_id, type=Chat.PRIVATE),
+        text=str(update_id),
+    )
+    return Update(update_id=update_id, message=message)
+
+
+class ChatOrderedApplicationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.app = (
+            ApplicationBuilder()
+            .token("123:TEST")
+            .application_class(ChatOrderedApplication)
+            .concurrent_updates(MAX_CONCURRENT_UPDATES)
+            .job_queue(None)
+            .build()
+        )
+        # Bot.initialize() با get_me به شبکه نیاز دارد؛ بقیه‌ی initialize() واقعی اجرا می‌شود
+        patcher = mock.patch.object(type(self.app.bot), "initialize", mock.AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        await self.app.initialize()
+
+    async def asyncTearDown(self):
+        await self.app.shutdown()
+
+    async def test_busy_chat_does_not_block_other_chats(self):
+        release_a = asyncio.Event()
+        processed = {1: [], 2: []}
+        b_done = asyncio.Event()
+
+        async def callback(update, context):
+            chat_id = update.effective_chat.id
+            if chat_id == 1:
+                await release_a.wait()
+            processed[chat_id].append(update.update_id)
+            if chat_id == 2:
+                b_done.set()
+
+        self.app.add_handler(TypeHandler(Update, callback))
+        await self.app.start()
+        try:
+            a_updates = MAX_CONCURRENT_UPDATES + 10
+            for update_id in range(a_updates):
+                await self.app.update_queue.put(make_update(update_id, 1))
+            await self.app.update_queue.put(make_update(1000, 2))
+
+            # با وجود بیش از ۶۴ آپدیت در انتظار در چت ۱، آپدیت چت ۲ پردازش می‌شود
+            await asyncio.wait_for(b_done.wait(), timeout=5)
+            self.assertEqual(processed[1], [])
+            self.assertEqual(processed[2], [1000])
+
+            release_a.set()
+        finally:
+            release_a.set()
+            await self.app.stop()
+
+        # آپدیت‌های چت ۱ به ترتیب و همه پردازش شده‌اند
+        self.assertEqual(processed[1], list(range(a_updates)))
+        self.assertEqual(self.app._chat_workers, {})
+
+
+class PinnedVersionTest(unittest.TestCase):
+    def test_requirements_pin_the_supported_ptb_version(self):
+        path = os.path.join(os.path.dirname(__file__), os.pardir, "requirements.txt")
+        with open(path, encoding="utf-8") as f:
+            pins = [line.strip() for line in f if line.startswith("python-telegram-bot")]
+        self.assertEqual(pins, [f"python-telegram-bot[job-queue]=={SUPPORTED_PTB_VERSION}"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import asyncio
+import re
+import unittest
+from unittest import mock
+
+import database as db
+from handlers import common
+from handlers.common import normalize_national_id, validate_national_id
+from tests.test_database import DatabaseTestCase
+
+
+def reference_validate_national_id(national_id: str) -> bool:
+    """پیاده‌سازی پیشین (regex و int) به‌عنوان مرجع."""
+    if not re.match(r"^\d{10}$", national_id):
+        return False
+    check = int(national_id[9])
+    s = sum(int(national_id[i]) * (10 - i) for i in range(9)) % 11
+    return (s < 2 and check == s) or (s >= 2 and check == 11 - s)
+
+
+class NationalIdTest(unittest.TestCase):
+    def test_matches_reference_on_ascii_ids(self):
+        for n in range(0, 10 ** 10, 7919 * 1009):
+            national_id = f"{n:010d}"
+            self.assertEqual(
+                validate_national_id(national_id),
+                reference_validate_national_id(national_id),
+                national_id,
+            )
+
+    def test_persian_and_arabic_digits_are_accepted(self):
+        for text in ("۰۰۱۳۵۴۲۴۱۹", "٠٠١٣٥٤٢٤١٩"):
+            self.assertTrue(reference_validate_national_id(text))
+            self.assertEqual(normalize_national_id(text), "0013542419")
+            self.assertTrue(validate_national_id(normalize_national_id(text)))
+
+    def test_invalid_ids_are_rejected(self):
+        for text in ("0013542418", "001354241", "00135424190", "abcdefghij", ""):
+            self.assertFalse(validate_national_id(normalize_national_id(text)), text)
+
+
+class UserWithAdminTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        for name, value in (("_admin_ids_lock", asyncio.Lock()), ("_admin_ids", set()), ("_admin_ids_expiry", 0.0)):
+            patcher = mock.patch.object(common, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        await db.create_user(1, "a b", "1", "1", "091")
+        async with db.write_conn() as conn, db.write_tx(conn):
+            await conn.execute("INSERT INTO admins (user_id, added_at) VALUES (1, 'x')")
+
+    async def test_repeated_lookups_are_served_from_cache(self):
+        user_info, is_admin = await common.get_user_with_admin(1)
+        self.assertEqual(user_info["full_name"], "a b")
+        self.assertTrue(is_admin)
+
+        with mock.patch.object(db, "read_conn", side_effect=AssertionError("database was queried")):
+            user_info, is_admin = await common.get_user_with_admin(1)
+        self.assertEqual(user_info["full_name"], "a b")
+        self.assertTrue(is_admin)
+
+    async def test_unknown_user_is_not_admin(self):
+        self.assertEqual(await common.get_user_with_admin(2), (None, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,251 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import aiosqlite
+
+import database as db
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """هر تست روی یک فایل پایگاه داده‌ی تازه در پوشه‌ی موقت اجرا می‌شود."""
+
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db_path = os.path.join(tmp.name, "test.db")
+        for name, value in (
+            ("DB_PATH", self.db_path),
+            # قفل ماژول به حلقه‌ی رویداد اولین استفاده گره می‌خورد؛ هر تست حلقه‌ی خودش را دارد
+            ("_write_lock", asyncio.Lock()),
+            ("OPERATOR_LOG_FLUSH_DELAY", 0.01),
+        ):
+            patcher = mock.patch.object(db, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for cache in (db._event_cache, db._user_cache, db._events_list_cache):
+            cache.clear()
+        await db.init_db()
+
+    async def asyncTearDown(self):
+        await db.close_db()
+
+    async def fetch_all(self, query, params=()):
+        async with db.read_conn() as conn:
+            async with conn.execute(query, params) as cursor:
+                return [tuple(row) for row in await cursor.fetchall()]
+
+    async def add_event(self, capacity=2, cost=0, event_type="دوره"):
+        async with db.write_conn() as conn, db.write_tx(conn):
+            cursor = await conn.execute(
+                "INSERT INTO events (title, type, date, location, capacity, is_active, hashtag, cost) "
+                "VALUES ('t', ?, '2025-01-01', 'x', ?, 1, 'h', ?)",
+                (event_type, capacity, cost),
+            )
+            return cursor.lastrowid
+
+
+class OperatorLogTest(DatabaseTestCase):
+    async def test_close_db_waits_for_pending_flush(self):
+        event_id = await self.add_event()
+        # تسک ذخیره‌ی تأخیری ردیف را از صف برمی‌دارد و پشت قفل نوشتن منتظر می‌ماند
+        async with db.write_conn():
+            await db.log_operator_message(10, -1, None, event_id, "final_list")
+            await asyncio.sleep(0.05)
+            closing = asyncio.create_task(db.close_db())
+            await asyncio.sleep(0.05)
+        await closing
+
+        await db.init_db()
+        rows = await self.fetch_all("SELECT message_id, user_id FROM operator_messages")
+        self.assertEqual(rows, [(10, None)])
+
+    async def test_merged_message_keeps_a_row_per_registration(self):
+        event_id = await self.add_event()
+        for user_id in (1, 2):
+            await db.create_user(user_id, "a b", "1", "1", "091")
+        await db.log_operator_messages([
+            (10, -1, 1, event_id, "registration"),
+            (10, -1, 2, event_id, "registration"),
+        ])
+        await db.close_db()
+
+        await db.init_db()
+        rows = await self.fetch_all("SELECT message_id, user_id FROM operator_messages ORDER BY user_id")
+        self.assertEqual(rows, [(10, 1), (10, 2)])
+
+
+class RegistrationTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        for user_id in range(1, 6):
+            await db.create_user(user_id, "a b", "1", "1", "091")
+
+    async def test_concurrent_registrations_respect_capacity(self):
+        event_id = await self.add_event(capacity=2, cost=1000, event_type="بازدید")
+        results = await asyncio.gather(*(db.register_user(user_id, event_id, 1000) for user_id in range(1, 6)))
+
+        self.assertEqual(sorted(results), [(db.EVENT_FULL, False)] * 3 + [(1, False), (2, True)])
+        self.assertEqual(await self.fetch_all("SELECT COUNT(*) FROM registrations"), [(2,)])
+        self.assertEqual(await self.fetch_all("SELECT COUNT(*) FROM payments"), [(2,)])
+        self.assertEqual((await db.get_event_details(event_id))["current_capacity"], 2)
+
+    async def test_courses_have_no_capacity_limit(self):
+        event_id = await self.add_event(capacity=1)
+        results = [await db.register_user(user_id, event_id) for user_id in (1, 2)]
+        self.assertEqual(results, [(1, False), (2, False)])
+
+    async def test_duplicate_registration_is_ignored(self):
+        event_id = await self.add_event(capacity=2, event_type="بازدید")
+        self.assertEqual(await db.register_user(1, event_id), (1, False))
+        self.assertEqual(await db.register_user(1, event_id), (0, False))
+        self.assertTrue(await db.is_registered(1, event_id))
+        self.assertEqual((await db.get_event_details(event_id))["current_capacity"], 1)
+
+
+class RatingWindowTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await db.create_user(1, "a b", "1", "1", "091")
+        self.event_id = await self.add_event()
+
+    async def test_rating_requires_an_open_feedback_window(self):
+        self.assertFalse(await db.store_rating_if_open(1, self.event_id, 4))
+
+        await db.set_feedback_sent(self.event_id, time.time() + 60)
+        self.assertTrue(await db.store_rating_if_open(1, self.event_id, 4))
+        # امتیاز دوباره جایگزین می‌شود و در تعداد دو بار شمرده نمی‌شود
+        self.assertTrue(await db.store_rating_if_open(1, self.event_id, 2))
+        ratings = await db.get_event_ratings(self.event_id)
+        self.assertEqual((ratings["num_ratings"], ratings["avg_rating"]), (1, 2))
+
+        await db.set_feedback_sent(self.event_id, time.time() - 1)
+        self.assertFalse(await db.store_rating_if_open(1, self.event_id, 5))
+
+    async def test_invalid_rating_is_rejected(self):
+        await db.set_feedback_sent(self.event_id, time.time() + 60)
+        self.assertFalse(await db.store_rating_if_open(1, self.event_id, 6))
+
+
+# ساختار جدول‌ها پیش از مهاجرت‌ها (ستون‌های زمانی TEXT)
+LEGACY_SCHEMA = """
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY, full_name TEXT, national_id TEXT, student_id TEXT, phone TEXT,
+        created_at TEXT NOT NULL
+    );
+    CREATE TABLE events (
+        event_id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, type TEXT, date TEXT NOT NULL,
+        location TEXT, capacity INTEGER, current_capacity INTEGER DEFAULT 0, description TEXT,
+        is_active INTEGER DEFAULT 1, hashtag TEXT, cost INTEGER DEFAULT 0, card_number TEXT,
+        deactivation_reason TEXT, feedback_sent_at TEXT
+    );
+    CREATE TABLE registrations (
+        registration_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, event_id INTEGER NOT NULL,
+        registered_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE,
+        UNIQUE(user_id, event_id)
+    );
+    CREATE TABLE operator_messages (
+        message_id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, event_id INTEGER,
+        message_type TEXT, sent_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE
+    );
+    CREATE TABLE event_ratings (
+        rating_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, event_id INTEGER NOT NULL,
+        rating INTEGER NOT NULL CHECK(rating >= 1 AND rating <= 5), submitted_at TEXT NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+        FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE,
+        UNIQUE(user_id, event_id)
+    );
+    INSERT INTO users VALUES (1, 'a b', '1', '1', '091', '2024-01-01T12:00:00');
+    INSERT INTO users VALUES (2, 'c d', '2', '2', '092', '1704103200');
+    INSERT INTO events (title, type, date, location, capacity, current_capacity, is_active, hashtag, feedback_sent_at)
+        VALUES ('t', 'دوره', '2024-01-01', 'x', 5, 7, 0, 'h', '1700000000.25');
+    INSERT INTO registrations (user_id, event_id, registered_at) VALUES (1, 1, '2024-01-01T12:00:00');
+    INSERT INTO registrations (user_id, event_id, registered_at) VALUES (2, 1, '1704103300');
+    INSERT INTO event_ratings (user_id, event_id, rating, submitted_at) VALUES (1, 1, 4, '1704103400');
+    INSERT INTO operator_messages VALUES (5, -1, 1, 1, 'registration', '2024-01-01T12:00:00');
+"""
+
+
+class MigrationTest(DatabaseTestCase):
+    async def asyncSetUp(self):
+        # init_db در خود تست‌ها روی پایگاه داده‌ی قدیمی اجرا می‌شود
+        with mock.patch.object(db, "init_db", mock.AsyncMock()):
+            await super().asyncSetUp()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript(LEGACY_SCHEMA)
+        conn.close()
+
+    def legacy_state(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+            return version, columns
+        finally:
+            conn.close()
+
+    async def test_epoch_columns_become_real(self):
+        await db.init_db()
+
+        for table, column in db.EPOCH_COLUMNS:
+            types = await self.fetch_all(f"SELECT DISTINCT typeof({column}) FROM {table} WHERE {column} IS NOT NULL")
+            self.assertEqual(types, [("real",)], f"{table}.{column}")
+        self.assertEqual(
+            await self.fetch_all("SELECT feedback_sent_at FROM events"), [(1700000000.25,)]
+        )
+        # داده‌ها و ارتباط‌ها سالم می‌مانند و تعداد ثبت‌نام‌ها هم‌گام می‌شود
+        self.assertEqual(await self.fetch_all("SELECT COUNT(*) FROM registrations"), [(2,)])
+        self.assertEqual(
+            await self.fetch_all("SELECT current_capacity, rating_sum, rating_count FROM events"), [(2, 4, 1)]
+        )
+        self.assertEqual(
+            await self.fetch_all("SELECT log_id, message_id, user_id FROM operator_messages"), [(1, 5, 1)]
+        )
+        self.assertEqual(await self.fetch_all("PRAGMA foreign_key_check"), [])
+        self.assertEqual(await self.fetch_all("PRAGMA user_version"), [(db.SCHEMA_VERSION,)])
+
+        # foreign_keys پس از مهاجرت دوباره فعال است
+        async with db.write_conn() as conn, db.write_tx(conn):
+            await conn.execute("DELETE FROM users WHERE user_id = 1")
+        self.assertEqual(await self.fetch_all("SELECT user_id FROM registrations"), [(2,)])
+
+    async def test_users_created_at_compares_numerically(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO users VALUES (4, 'g h', '4', '4', '094', '999999999.5')")
+        conn.close()
+        await db.init_db()
+        await db.create_user(3, "e f", "3", "3", "093")
+
+        # مقدار کاربر 1 از زمان محلی ISO تبدیل شده و به منطقه‌ی زمانی سیستم بستگی دارد
+        self.assertEqual(
+            await self.fetch_all("SELECT user_id FROM users WHERE user_id != 1 ORDER BY created_at"),
+            [(4,), (2,), (3,)],
+        )
+        self.assertEqual(
+            await self.fetch_all(
+                "SELECT user_id FROM users WHERE user_id != 1 AND created_at >= ? ORDER BY user_id", (1704103200,)
+            ),
+            [(2,), (3,)],
+        )
+
+    async def test_failed_migration_is_rolled_back_and_raised(self):
+        with mock.patch.object(db, "_rebuild_table", side_effect=aiosqlite.OperationalError("boom")):
+            with self.assertRaises(aiosqlite.OperationalError):
+                await db.init_db()
+        await db.close_db()
+
+        version, columns = self.legacy_state()
+        self.assertEqual(version, 0)
+        self.assertNotIn("rating_sum", columns)
+
+
+if __name__ == "__main__":
+    unittest.main()